@@ -0,0 +1,264 @@
+import get
+import configParser
+from heapq import heappush, heappop, heapify
+from itertools import count
+from threading import Condition, Thread
+from datetime import datetime, timedelta
+import logging
+
+# Connect logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+lead_minutes = getattr(configParser, 'alert_lead_minutes', 60)  # how long before the change the alert is sent
+
+
+class AlertScheduler:
+    """The object sends the activity change alert to every person once, at the lead time before the change.
+    The changes are kept in a heap by the alert time and are replaced only for the people whose schedule has changed.
+
+    send - function queueing the message, takes the chat id and the text
+    lead - how long before the change the alert is sent
+    heap - the alerts as (alert time, number, tg username, version, start, action)
+    versions - version of the schedule by tg username, the alerts of the old versions are skipped
+    counts - number of the alerts of the current version in the heap by tg username
+    stale - number of the alerts of the old versions in the heap, the heap is rebuilt when they are the most of it
+    fired - the sent alerts as (tg username, start, action)
+
+    """
+
+    def __init__(self,
+                 send,
+                 lead=timedelta(minutes=lead_minutes)
+                 ):
+        self.send = send
+        self.lead = lead
+        self.heap = []
+        self.versions = {}
+        self.counts = {}
+        self.stale = 0
+        self.fired = set()
+        self.numbers = count()
+        self.condition = Condition()
+        self.thread = None
+        self.running = False
+
+    def __repr__(self):
+        return f'<AlertScheduler(lead="{self.lead}", alerts="{len(self.heap)}", people="{len(self.versions)}")>'
+
+    def update(self, username: str, events: list) -> None:
+        """The function of replacing the alerts of the person by the changes of the action in the events.
+
+        :param username: the person's tg username
+        :type username: str
+
+        :param events: all the person's Event objects
+        :type events: list[Event, ...]
+
+        :return: nothing
+        :rtype: None
+        """
+
+        now = datetime.now()
+
+        with self.condition:
+            version = self.versions[username] = self.versions.get(username, 0) + 1
+            self.stale += self.counts.pop(username, 0)
+            action, pushed = None, 0
+
+            for event in sorted(events):
+                if event.action != action and event.start > now:
+                    heappush(self.heap, (event.start - self.lead, next(self.numbers), username, version, event.start, event.action))
+                    pushed += 1
+                action = event.action
+
+            if pushed:
+                self.counts[username] = pushed
+
+            self.prune()
+            self.condition.notify()
+
+    def load(self, alerts: list) -> None:
+        """The function of replacing the alerts of the people by the alerts in the form of the items function.
+
+        :param alerts: the alerts as (tg username, start, action)
+        :type alerts: list[tuple[str, datetime, str], ...]
+
+        :return: nothing
+        :rtype: None
+        """
+
+        people = {}
+        for username, start, action in alerts:
+            people.setdefault(username, []).append((start, action))
+
+        with self.condition:
+            for username, changes in people.items():
+                version = self.versions[username] = self.versions.get(username, 0) + 1
+                self.stale += self.counts.pop(username, 0)
+
+                for start, action in changes:
+                    heappush(self.heap, (start - self.lead, next(self.numbers), username, version, start, action))
+                self.counts[username] = len(changes)
+
+            self.prune()
+            self.condition.notify()
+
+    def items(self) -> list:
+        """The function of getting the alerts that aren't sent yet in the form of the load function.
+
+        :return: the alerts as (tg username, start, action)
+        :rtype: list[tuple[str, datetime, str], ...]
+        """
+
+        with self.condition:
+            return [
+                (username, start, action) for _, _, username, version, start, action in self.heap
+                if self.versions.get(username) == version
+            ]
+
+    def remove(self, username: str) -> None:
+        """The function of cancelling the alerts of the person.
+
+        :param username: the person's tg username
+        :type username: str
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.condition:
+            self.versions.pop(username, None)
+            self.stale += self.counts.pop(username, 0)
+            self.prune()
+
+    def clear(self) -> None:
+        """The function of cancelling all the alerts.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.condition:
+            self.heap = []
+            self.versions = {}
+            self.counts = {}
+            self.stale = 0
+
+    def prune(self) -> None:
+        """The function of dropping the alerts of the old versions, the lock must be held by the caller.
+        The old alerts are popped from the top of the heap, the heap is rebuilt when they are the most of it.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        while self.heap and self.versions.get(self.heap[0][2]) != self.heap[0][3]:
+            heappop(self.heap)
+            self.stale -= 1
+
+        if self.stale > len(self.heap) // 2:
+            self.heap = [alert for alert in self.heap if self.versions.get(alert[2]) == alert[3]]
+            heapify(self.heap)
+            self.stale = 0
+
+    def next_alert(self) -> datetime or None:
+        """The function of getting the time of the nearest alert.
+
+        :return: the time or None if there are no alerts
+        :rtype: datetime | None
+        """
+
+        with self.condition:
+            self.prune()
+            return self.heap[0][0] if self.heap else None
+
+    def start(self) -> None:
+        """The function of launching the thread of the alerts.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        self.running = True
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """The function of stopping the thread of the alerts.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+        if self.thread:
+            self.thread.join()
+
+    def run(self) -> None:
+        """The function of the thread waiting for the nearest alert.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        while True:
+            with self.condition:
+                while self.running and (not self.heap or self.heap[0][0] > datetime.now()):
+                    # wake up at least once a minute in case the system clock has been changed
+                    timeout = min((self.heap[0][0] - datetime.now()).total_seconds(), 60) if self.heap else None
+                    self.condition.wait(timeout)
+
+                if not self.running:
+                    return
+
+                _, _, username, version, start, action = heappop(self.heap)
+
+                if self.versions.get(username) != version:
+                    self.stale -= 1
+                    continue
+
+                self.counts[username] -= 1
+                if not self.counts[username]:
+                    del self.counts[username]
+
+                if (username, start, action) in self.fired:
+                    continue
+
+                if start <= datetime.now():  # the change has already begun
+                    continue
+
+                self.fired.add((username, start, action))
+
+            try:
+                self.fire(username, start, action)
+            except Exception as e:
+                print(f'{datetime.now()} - db.alerts.AlertScheduler.run - {e}')
+
+    def fire(self, username: str, start: datetime, action: str) -> None:
+        """The function of updating the person's current action and sending the alert.
+
+        :param username: the person's tg username
+        :type username: str
+
+        :param start: start of the new action
+        :type start: datetime
+
+        :param action: the new action
+        :type action: str
+
+        :return: nothing
+        :rtype: None
+        """
+
+        chat_id = get.current_action(username=username, action=action)
+
+        if chat_id:
+            self.send(chat_id, f'Смена деятельности:\n'
+                               f'С {start} - {action}')
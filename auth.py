@@ -0,0 +1,163 @@
+from threading import Lock
+import logging
+
+# Connect logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+class AuthCache:
+    """The object keeps the organizers of the event for the authorization without the db.
+    The authorized users are found by the tg chat id, so they stay authorized after changing the tg username.
+
+    chats - the person's db id by the tg chat id of the authorized people
+    usernames - the person's db id by the tg username of all the organizers
+    people - (tg username, tg chat id) by the person's db id
+
+    """
+
+    def __init__(self):
+        self.chats = {}
+        self.usernames = {}
+        self.people = {}
+        self.lock = Lock()
+
+    def __repr__(self):
+        return f'<AuthCache(people="{len(self.people)}", chats="{len(self.chats)}")>'
+
+    def load(self, people: list) -> None:
+        """The function of adding the organizers.
+
+        :param people: the organizers as (person's db id, tg username, tg chat id)
+        :type people: list[tuple[int, str, int], ...]
+
+        :return: nothing
+        :rtype: None
+        """
+
+        for person_id, username, chat_id in people:
+            self.add(person_id, username, chat_id)
+
+    def add(self, person_id: int, username: str, chat_id=0) -> None:
+        """The function of adding the organizer or changing the organizer's tg username and chat id.
+
+        :param person_id: the person's db id
+        :type person_id: int
+
+        :param username: the person's tg username
+        :type username: str
+
+        :param chat_id: the person's tg chat id, 0 if the person hasn't written to the bot
+        :type chat_id: int
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.lock:
+            self.discard(person_id)
+
+            self.people[person_id] = (username, chat_id)
+            self.usernames[username] = person_id
+            if chat_id:
+                self.chats[chat_id] = person_id
+
+    def items(self) -> list:
+        """The function of getting all the organizers in the form of the load function.
+
+        :return: the organizers as (person's db id, tg username, tg chat id)
+        :rtype: list[tuple[int, str, int], ...]
+        """
+
+        with self.lock:
+            return [(person_id, username, chat_id) for person_id, (username, chat_id) in self.people.items()]
+
+    def login(self, person_id: int, chat_id: int) -> None:
+        """The function of authorizing the chat of the organizer.
+
+        :param person_id: the person's db id
+        :type person_id: int
+
+        :param chat_id: the person's tg chat id
+        :type chat_id: int
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.lock:
+            username, _ = self.people.get(person_id, ('', 0))
+
+        self.add(person_id, username, chat_id)
+
+    def remove(self, person_id: int) -> None:
+        """The function of removing the organizer.
+
+        :param person_id: the person's db id
+        :type person_id: int
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.lock:
+            self.discard(person_id)
+
+    def discard(self, person_id: int) -> None:
+        """The function of removing the organizer's keys, the lock must be held by the caller.
+
+        :param person_id: the person's db id
+        :type person_id: int
+
+        :return: nothing
+        :rtype: None
+        """
+
+        username, chat_id = self.people.pop(person_id, ('', 0))
+
+        if self.usernames.get(username) == person_id:
+            del self.usernames[username]
+        if self.chats.get(chat_id) == person_id:
+            del self.chats[chat_id]
+
+    def is_authorized(self, chat_id: int) -> bool:
+        """The function of checking if the chat belongs to the authorized organizer.
+
+        :param chat_id: the user's tg chat id
+        :type chat_id: int
+
+        :return: True if the user is authorized
+        :rtype: bool
+        """
+
+        return chat_id in self.chats
+
+    def person_id(self, chat_id: int) -> int or None:
+        """The function of getting the person of the authorized chat.
+
+        :param chat_id: the user's tg chat id
+        :type chat_id: int
+
+        :return: the person's db id or None
+        :rtype: int | None
+        """
+
+        return self.chats.get(chat_id)
+
+    def organizer(self, username: str) -> int or None:
+        """The function of getting the organizer by the tg username.
+
+        :param username: the user's tg username
+        :type username: str
+
+        :return: the person's db id or None if the user isn't the organizer
+        :rtype: int | None
+        """
+
+        return self.usernames.get(username)
+
+
+users = AuthCache()  # the organizers of the event
@@ -0,0 +1,369 @@
+"""The benchmark of the update pipeline on a synthetic sheet.
+
+Runs offline: the config modules, the Google client and the tg bot are replaced by stand-ins
+and the schedule is stored in a temporary SQLite db.
+
+    python bench.py --people 300 --slots 63 --edit-rate 0.01
+    python bench.py --save  # store the results as the new baseline
+
+"""
+
+from datetime import datetime, timedelta
+from types import ModuleType, SimpleNamespace
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ACTIONS = ['Отдых', 'Регистрация', 'Гардероб', 'Зал 1', 'Зал 2', 'Зал 3', 'Кофе-брейк', 'Штаб', 'Выход']
+
+
+def generate(people: int, slots: int, seed=0) -> list:
+    """The function of creating the rows of a realistic schedule sheet.
+    The first row is the header with the times of the slots, every other row is a person with
+    the name, the tg username, four service cells and the actions lasting from 1 to 8 slots.
+
+    :param people: number of the people
+    :type people: int
+
+    :param slots: number of the 15 minutes slots
+    :type slots: int
+
+    :param seed: seed of the random generator
+    :type seed: int
+
+    :return: rows of the sheet
+    :rtype: list[list[str, ...], ...]
+    """
+
+    generator = random.Random(seed)
+    start = datetime(2021, 10, 2, 8, 0)
+
+    rows = [['ФИО', 'Телеграм', '', '', '', ''] + [
+        f'{(start + timedelta(minutes=15 * slot)):%-H:%M}' for slot in range(slots)
+    ]]
+
+    for person in range(people):
+        actions = []
+        while len(actions) < slots:
+            actions.extend([generator.choice(ACTIONS)] * generator.randint(1, 8))
+
+        rows.append([f'Фамилия{person} Имя{person}', f'user{person}', '', '', '', ''] + actions[:slots])
+
+    return rows
+
+
+def edit(rows: list, rate: float, seed=1) -> list:
+    """The function of creating the next snapshot of the sheet with the part of the action cells changed.
+
+    :param rows: rows of the sheet
+    :type rows: list[list[str, ...], ...]
+
+    :param rate: part of the action cells to change
+    :type rate: float
+
+    :param seed: seed of the random generator
+    :type seed: int
+
+    :return: rows of the changed sheet
+    :rtype: list[list[str, ...], ...]
+    """
+
+    generator = random.Random(seed)
+    rows = [list(row) for row in rows]
+    cells = [(row, column) for row in range(1, len(rows)) for column in range(6, len(rows[row]))]
+
+    for row, column in generator.sample(cells, int(len(cells) * rate)):
+        rows[row][column] = generator.choice([action for action in ACTIONS if action != rows[row][column]])
+
+    return rows
+
+
+class FakeRequest:
+    """The stand-in of the Google API request, the response is decoded from JSON as the real one."""
+
+    def __init__(self, payload: str):
+        self.payload = payload
+
+    def execute(self) -> dict:
+        return json.loads(self.payload)
+
+
+class FakeSheets:
+    """The stand-in of the Sheets service answering both the grid data and the values requests.
+    The responses are encoded when the rows are set, so only the decoding is measured as the fetching.
+
+    payloads - JSON responses by the kind of the request
+    transferred - number of the bytes of the last response
+
+    """
+
+    def __init__(self, rows: list):
+        self.payloads = {}
+        self.transferred = 0
+        self.set_rows(rows)
+
+    def set_rows(self, rows: list) -> None:
+        """The function of changing the sheet.
+
+        :param rows: rows of the sheet
+        :type rows: list[list[str, ...], ...]
+
+        :return: nothing
+        :rtype: None
+        """
+
+        self.rows = rows
+
+        # values only, row-major
+        self.payloads['rows'] = json.dumps({'values': rows}, ensure_ascii=False)
+
+        # grid data with the formatting as the real response has
+        self.payloads['grid'] = json.dumps({'sheets': [{'data': [{'rowData': [
+            {'values': [
+                {
+                    'formattedValue': value,
+                    'userEnteredValue': {'stringValue': value},
+                    'effectiveFormat': {'backgroundColor': {'red': 1, 'green': 1, 'blue': 1}}
+                } if value else {} for value in row
+            ]} for row in rows
+        ]}]}]}, ensure_ascii=False)
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, **kwargs) -> FakeRequest:
+        payload = self.payloads['rows' if 'range' in kwargs else 'grid']
+
+        self.transferred = len(payload.encode())
+
+        return FakeRequest(payload)
+
+
+class FakeClient:
+    """The stand-in of the GoogleClient."""
+
+    def __init__(self, sheets: FakeSheets):
+        self.sheets = sheets
+
+    def service(self, name: str, version: str) -> FakeSheets:
+        return self.sheets
+
+
+class FakeBot:
+    """The stand-in of the tg bot counting the sent messages."""
+
+    def __init__(self):
+        self.sent = 0
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent += 1
+
+
+def configure(directory: str) -> None:
+    """The function of replacing the config modules before the modules of the bot are imported.
+
+    :param directory: directory of the temporary db
+    :type directory: str
+
+    :return: nothing
+    :rtype: None
+    """
+
+    configs = {
+        'configDB': {'connect_path': f'sqlite:///{os.path.join(directory, "bench.db")}'},
+        'configParser': {
+            'ggl_token_file_name': os.path.join(directory, 'token.json'),
+            'credentials_file_name': os.path.join(directory, 'credentials.json'),
+            'spreadsheet_id': 'bench',
+            'ranges': 'A:ZZ'
+        },
+        'configBot': {'token': '123456:bench', 'workers': 1}
+    }
+
+    for name, values in configs.items():
+        module = ModuleType(name)
+        module.__dict__.update(values)
+        sys.modules[name] = module
+
+
+def measure(function, repeat=1) -> tuple:
+    """The function of running the stage and measuring its best time and peak memory.
+
+    :param function: the stage, called without arguments
+    :type function: Callable
+
+    :param repeat: number of the runs
+    :type repeat: int
+
+    :return: result of the last run, the best time in seconds and the peak memory in bytes
+    :rtype: tuple
+    """
+
+    best, peak, result = None, 0, None
+
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+
+        result = function()
+
+        duration = time.perf_counter() - start
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        best = duration if best is None else min(best, duration)
+
+    return result, best, peak
+
+
+def run(people: int, slots: int, edit_rate: float, repeat: int) -> dict:
+    """The function of running every stage of the pipeline.
+
+    :param people: number of the people
+    :type people: int
+
+    :param slots: number of the slots
+    :type slots: int
+
+    :param edit_rate: part of the action cells changed between the snapshots
+    :type edit_rate: float
+
+    :param repeat: number of the runs of the read only stages
+    :type repeat: int
+
+    :return: the time, the throughput and the peak memory by the stage name
+    :rtype: dict
+    """
+
+    import schedule_parser
+    import get
+    import main
+
+    sheets = FakeSheets(generate(people, slots))
+    schedule_parser.client = FakeClient(sheets)
+    bot = FakeBot()
+    main.bot.send_message = bot.send_message
+
+    results = {}
+
+    def record(stage, items, function, times=1):
+        result, duration, peak = measure(function, times)
+        results[stage] = {
+            'seconds': round(duration, 6),
+            'items': items,
+            'per_second': round(items / duration, 1) if duration else None,
+            'peak_bytes': peak
+        }
+        return result
+
+    events = people * slots
+
+    for mode in ('grid', 'values'):
+        schedule_parser.fetch_mode = mode
+        record(f'get_rows.{mode}', people, lambda: schedule_parser.get_rows('bench', 'A:ZZ'), repeat)
+        results[f'get_rows.{mode}']['transferred_bytes'] = sheets.transferred
+
+    rows = schedule_parser.get_rows('bench', 'A:ZZ')
+    parsed = record('parser.full', events, lambda: schedule_parser.parse_rows(rows, {}), repeat)
+    record('events_to_db.first_sync', events,
+           lambda: get.events_to_db(parsed.events, changed=parsed.changed, removed=parsed.removed))
+
+    sheets.set_rows(edit(sheets.rows, edit_rate))
+    rows = schedule_parser.get_rows('bench', 'A:ZZ')
+    changes = record('parser.incremental', events,
+                     lambda: schedule_parser.parse_rows(rows, parsed.fingerprints), repeat)
+    record('events_to_db.incremental', len(changes.events),
+           lambda: get.events_to_db(changes.events, changed=changes.changed, removed=changes.removed))
+
+    def pipeline():  # the poll of the updater: the fetch, the parse and the db update of the whole sheet
+        fetched = schedule_parser.parse_rows(schedule_parser.get_rows('bench', 'A:ZZ'))
+        return get.events_to_db(fetched.events, changed=fetched.changed, removed=fetched.removed)
+
+    sheets.set_rows(edit(sheets.rows, edit_rate, seed=2))
+    record('pipeline.full', events, pipeline)
+
+    messages = [
+        SimpleNamespace(chat=SimpleNamespace(id=person + 1), text=f'Фамилия{person}')
+        for person in range(people)
+    ]
+
+    def send_all():
+        for person, message in enumerate(messages):
+            main.send_schedule(message=message, first_name=f'Имя{person}')
+
+    get.schedules.clear()
+    record('send_schedule.cold', people, send_all)
+    record('send_schedule.warm', people, send_all, repeat)
+    results['send_schedule.warm']['sent'] = bot.sent
+    results['events_to_db.incremental']['changed_people'] = len(changes.changed)
+
+    return results
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """The function of printing the results with the change of the time against the baseline.
+
+    :param results: the results of the run
+    :type results: dict
+
+    :param baseline: the stored results
+    :type baseline: dict
+
+    :return: nothing
+    :rtype: None
+    """
+
+    print(f'{"stage":28} {"seconds":>10} {"items/s":>12} {"peak MiB":>9} {"vs baseline":>12}')
+
+    for stage, result in results.items():
+        base = baseline.get(stage)
+        change = f'{(result["seconds"] / base["seconds"] - 1) * 100:+.0f}%' if base and base['seconds'] else '-'
+        print(f'{stage:28} {result["seconds"]:10.4f} {result["per_second"] or 0:12.0f} '
+              f'{result["peak_bytes"] / 2 ** 20:9.1f} {change:>12}')
+
+
+def main() -> None:
+    """The main function.
+    Parses the arguments, runs the benchmark and compares it with the baseline.
+
+    :return: nothing
+    :rtype: None
+    """
+
+    arguments = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arguments.add_argument('--people', type=int, default=300)
+    arguments.add_argument('--slots', type=int, default=63)
+    arguments.add_argument('--edit-rate', type=float, default=0.01)
+    arguments.add_argument('--repeat', type=int, default=3)
+    arguments.add_argument('--baseline', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json'))
+    arguments.add_argument('--save', action='store_true', help='store the results as the baseline')
+    args = arguments.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(directory)
+        results = run(args.people, args.slots, args.edit_rate, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    key = f'{args.people}x{args.slots}@{args.edit_rate}'
+    compare(results, baseline.get(key, {}))
+
+    if args.save:
+        baseline[key] = results
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=4, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
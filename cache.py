@@ -0,0 +1,204 @@
+from collections import OrderedDict
+from threading import Lock
+import logging
+
+# Connect logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+class ScheduleCache:
+    """The object keeps the schedules of the recently requested people, the least recently used ones are evicted.
+    Every schedule is stored once by the person's db id and is found by any of its keys, e.g.
+        ('id', 1), ('username', 'tg_username'), ('name', 'first_name', 'last_name'), ('surname', 'last_name')
+    The schedule read from the db is stored with the token taken before the read, it isn't stored
+    if the person has been invalidated since, so the schedule read before the db change doesn't outlive it.
+
+    maxsize - maximum number of the stored schedules
+    entries - schedules by the person's db id
+    keys - the person's db id by every key
+    hits - number of the requests found in the cache
+    misses - number of the requests not found in the cache
+    sequence - number of the invalidations
+    invalidated - the sequence of the last invalidation by the person's db id
+    cleared - the sequence of the last clear
+
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.keys = {}
+        self.aliases = {}  # keys by the person's db id
+        self.hits = 0
+        self.misses = 0
+        self.sequence = 0
+        self.invalidated = {}
+        self.cleared = 0
+        self.lock = Lock()
+
+    def __repr__(self):
+        return f'<ScheduleCache(maxsize="{self.maxsize}", size="{len(self.entries)}", hits="{self.hits}", misses="{self.misses}")>'
+
+    def get(self, key: tuple) -> dict or None:
+        """The function of getting the schedule by the key.
+
+        :param key: one of the person's keys
+        :type key: tuple
+
+        :return: the schedule or None if it isn't in the cache
+        :rtype: dict | None
+        """
+
+        with self.lock:
+            person_id = self.keys.get(key)
+
+            if person_id is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.entries.move_to_end(person_id)
+
+            return self.entries[person_id]
+
+    def token(self) -> int:
+        """The function of getting the token to take before reading the schedule from the db.
+
+        :return: the number of the invalidations so far
+        :rtype: int
+        """
+
+        with self.lock:
+            return self.sequence
+
+    def put(self, person_id: int, entry: dict, keys: list, token=None) -> bool:
+        """The function of storing the schedule.
+
+        :param person_id: the person's db id
+        :type person_id: int
+
+        :param entry: the schedule
+        :type entry: dict
+
+        :param keys: the keys to find the schedule by
+        :type keys: list[tuple, ...]
+
+        :param token: the token taken before the schedule was read, the schedule is stored anyway if None
+        :type token: int | None
+
+        :return: True if the schedule is stored, False if it has been invalidated since the token
+        :rtype: bool
+        """
+
+        with self.lock:
+            if token is not None and max(self.invalidated.get(person_id, 0), self.cleared) > token:
+                return False
+
+            self.discard(person_id)
+
+            self.entries[person_id] = entry
+            self.aliases[person_id] = set(keys)
+            for key in keys:
+                self.keys[key] = person_id
+
+            while len(self.entries) > self.maxsize:
+                self.discard(next(iter(self.entries)))
+
+        return True
+
+    def update(self, person_id: int, **fields) -> None:
+        """The function of changing the fields of the stored schedule in place.
+        The schedules read before the change aren't stored, as after the invalidation.
+
+        :param person_id: the person's db id
+        :type person_id: int
+
+        :param fields: new values of the fields
+        :type fields: dict
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.lock:
+            self.sequence += 1
+            self.invalidated[person_id] = self.sequence
+
+            if person_id in self.entries:
+                self.entries[person_id] = dict(self.entries[person_id], **fields)
+
+    def invalidate(self, person_ids) -> None:
+        """The function of removing the schedules of the people.
+
+        :param person_ids: the people's db ids
+        :type person_ids: Iterable[int]
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.lock:
+            self.sequence += 1
+
+            for person_id in person_ids:
+                self.discard(person_id)
+                self.invalidated[person_id] = self.sequence
+
+    def items(self) -> list:
+        """The function of getting all the schedules from the least recently used one.
+
+        :return: the schedules as (person's db id, schedule, keys) in the form of the put function
+        :rtype: list[tuple[int, dict, list], ...]
+        """
+
+        with self.lock:
+            return [(person_id, entry, list(self.aliases[person_id])) for person_id, entry in self.entries.items()]
+
+    def clear(self) -> None:
+        """The function of removing all the schedules.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.lock:
+            self.sequence += 1
+            self.cleared = self.sequence
+            self.invalidated.clear()
+            self.entries.clear()
+            self.keys.clear()
+            self.aliases.clear()
+
+    def discard(self, person_id: int) -> None:
+        """The function of removing the schedule and its keys, the lock must be held by the caller.
+
+        :param person_id: the person's db id
+        :type person_id: int
+
+        :return: nothing
+        :rtype: None
+        """
+
+        self.entries.pop(person_id, None)
+
+        for key in self.aliases.pop(person_id, ()):
+            if self.keys.get(key) == person_id:
+                del self.keys[key]
+
+    def stats(self) -> dict:
+        """The function of getting the counters of the cache.
+
+        :return: size, hits and misses of the cache
+        :rtype: dict
+        """
+
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -1,7 +1,11 @@
+import configDB
+import metrics
 from configDB import connect_path
 from sqlalchemy import *
+from sqlalchemy import event
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, timezone, timedelta
+from threading import Lock
 import logging
 
 # Connect logging
@@ -11,8 +15,59 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+pool_stats = {
+    'connects': 0,
+    'checkouts': 0,
+    'checkins': 0,
+    'checked_out': 0,
+    'max_checked_out': 0
+}  # counters of the connection pool
+pool_lock = Lock()
+
+
 try:
-    engine = create_engine(connect_path, pool_size=1000)
+    if connect_path.startswith('sqlite'):  # SQLite pools don't take the size settings
+        engine = create_engine(connect_path)
+
+    else:
+        engine = create_engine(
+            connect_path,
+            pool_size=getattr(configDB, 'pool_size', 10),
+            max_overflow=getattr(configDB, 'max_overflow', 20),
+            pool_recycle=getattr(configDB, 'pool_recycle', 1800),
+            pool_timeout=getattr(configDB, 'pool_timeout', 30),
+            pool_pre_ping=True
+        )
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        with pool_lock:
+            pool_stats['connects'] += 1
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        with pool_lock:
+            pool_stats['checkouts'] += 1
+            pool_stats['checked_out'] += 1
+            pool_stats['max_checked_out'] = max(pool_stats['max_checked_out'], pool_stats['checked_out'])
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        with pool_lock:
+            pool_stats['checkins'] += 1
+            pool_stats['checked_out'] -= 1
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def on_execute(connection, cursor, statement, parameters, context, executemany):
+        metrics.db_queries.inc()
+
+    def pool_metrics():
+        with pool_lock:
+            for name, value in pool_stats.items():
+                metrics.db_pool.set(value, name=name)
+
+    metrics.registry.collect(pool_metrics)
+
     db = declarative_base()
 
     class PersonDB(db):
@@ -29,11 +84,15 @@ try:
 
         id = Column(Integer, primary_key=True)
         first_name = Column(String)
-        last_name = Column(String)
-        tg_chat_id = Column(Integer)
+        last_name = Column(String, index=True)
+        tg_chat_id = Column(Integer, index=True)
         tg_username = Column(String, unique=True)
         current_action = Column(String)
 
+        __table_args__ = (
+            Index('ix_people_first_name_last_name', 'first_name', 'last_name'),
+        )
+
         def __init__(self,
                      first_name='first_name',
                      last_name='last_name',
@@ -44,7 +103,7 @@ try:
             self.first_name = first_name
             self.last_name = last_name
             self.tg_chat_id = tg_chat_id
-            self.tg_username = tg_username,
+            self.tg_username = tg_username
             self.current_action = current_action
 
         def __repr__(self):
@@ -54,6 +113,7 @@ try:
     class EventDB(db):
         """The object is a cell in the schedule table in the db.
 
+        event_id - id of the event of the bot whose spreadsheet has the cell
         person_id - person's id in the people table in the db who should do the event
         action - action to be taken by a person
         start - start date and time of the event
@@ -64,26 +124,109 @@ try:
         __tablename__ = 'schedule'
 
         id = Column(Integer, primary_key=True)
+        event_id = Column(String, default='default', server_default='default')
         person_id = Column(Integer, ForeignKey(PersonDB.id))
         action = Column(String)
         start = Column(DateTime)
         end = Column(DateTime)
 
+        __table_args__ = (
+            Index('ix_schedule_event_id_person_id_start', 'event_id', 'person_id', 'start', unique=True),
+            Index('ix_schedule_person_id_start', 'person_id', 'start'),
+        )
+
         def __init__(self,
+                     event_id='default',
                      person_id=0,
                      action='None',
                      start=datetime.strptime('0:00', '%H:%M').time(),
                      end=datetime.strptime('0:00', '%H:%M').time()
                      ):
+            self.event_id = event_id
             self.person_id = person_id
             self.action = action
             self.start = start
             self.end = end
 
         def __repr__(self):
-            return f'<Event(person_id="{self.person_id}", action="{self.action}", start="{self.start}", end="{self.end}")>'
+            return f'<Event(event_id="{self.event_id}", person_id="{self.person_id}", action="{self.action}", start="{self.start}", end="{self.end}")>'
+
+
+    class LeaseDB(db):
+        """The object is a cell in the leases table in the db.
+
+        name - name of the work done by one replica of the bot
+        holder - id of the replica holding the lease
+        expires - time in UTC when the lease may be taken by another replica
+        revision - number of the db changes, the changed people of every revision are in the changes table
+
+        """
+
+        __tablename__ = 'leases'
+
+        name = Column(String, primary_key=True)
+        holder = Column(String)
+        expires = Column(DateTime)
+        revision = Column(Integer, default=0)
+
+        def __init__(self,
+                     name='updater',
+                     holder='',
+                     expires=datetime.utcnow(),
+                     revision=0
+                     ):
+            self.name = name
+            self.holder = holder
+            self.expires = expires
+            self.revision = revision
+
+        def __repr__(self):
+            return f'<Lease(name="{self.name}", holder="{self.holder}", expires="{self.expires}", revision="{self.revision}")>'
+
+    class ChangeDB(db):
+        """The object is a cell in the changes table in the db.
+
+        revision - the revision of the lease made by the change
+        person_ids - db ids of the changed people separated by commas
+
+        """
+
+        __tablename__ = 'changes'
+
+        revision = Column(Integer, primary_key=True, autoincrement=False)
+        person_ids = Column(Text, default='')
+
+        def __init__(self,
+                     revision=0,
+                     person_ids=''
+                     ):
+            self.revision = revision
+            self.person_ids = person_ids
+
+        def __repr__(self):
+            return f'<Change(revision="{self.revision}", person_ids="{self.person_ids}")>'
 
     db.metadata.create_all(engine)
 
+    # the schedule of the db made for the single event is the schedule of the event 'default'
+    if 'event_id' not in {column['name'] for column in inspect(engine).get_columns('schedule')}:
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE schedule ADD COLUMN event_id VARCHAR DEFAULT 'default'"))
+            connection.execute(text('DROP INDEX IF EXISTS ix_schedule_person_id_start'))  # the unique one
+
+    # the old schedule may have the same slot of the person twice, only the last written row is kept
+    if 'ix_schedule_event_id_person_id_start' not in {index['name'] for index in inspect(engine).get_indexes('schedule')}:
+        with engine.begin() as connection:
+            connection.execute(text(
+                'DELETE FROM schedule WHERE id NOT IN '
+                '(SELECT MAX(id) FROM schedule GROUP BY event_id, person_id, start)'
+            ))
+
+    # create_all skips the tables that already exist, so add the missing indexes explicitly
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
 except Exception as e:
     print(f'{datetime.now(timezone(timedelta(hours=3.0)))} - db.create - "{e}"')
+    raise  # the bot can't write the schedule without the tables and the unique index
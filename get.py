@@ -1,9 +1,17 @@
 from create import engine, PersonDB, EventDB
-from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy import asc
-from schedule_parser import Event
+from sqlalchemy.orm import sessionmaker, scoped_session, Session
+from sqlalchemy import asc, exists
+from sqlalchemy.dialects import postgresql, sqlite
+from schedule_parser import Event, EventFeed, Person, event_sheets
+from cache import ScheduleCache
+from render import schedule_messages, grouped_messages
+import names
+import auth
+import configDB
+import metrics
+from contextlib import contextmanager
+import time
 import logging
-from datetime import datetime
 
 # Connect logging
 logging.basicConfig(
@@ -12,19 +20,69 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+upserts = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert
+}  # dialects with the INSERT ... ON CONFLICT statement
 
-def session() -> Session:
-    """The function of getting a connection to the db.
+schedules = ScheduleCache(maxsize=getattr(configDB, 'cache_size', 1024))  # the schedules read by the handlers
+batch_size = getattr(configDB, 'batch_size', 1000)  # the rows of the schedule are written by this many
+
+
+def schedules_metrics() -> None:
+    for name, value in schedules.stats().items():
+        metrics.schedule_cache.set(value, name=name)
+
+
+metrics.registry.collect(schedules_metrics)
+
+
+session_factory = sessionmaker(bind=engine)
+scoped = scoped_session(session_factory)  # one session per thread
+
+
+@contextmanager
+def session_scope() -> Session:
+    """The context manager of the current thread's session.
+    Commits on exit, rolls back on exception and returns the connection to the pool.
+    The nested scopes use the session of the outer one.
 
     :return: connected session to db
     :rtype: Session
     """
 
-    return sessionmaker(bind=engine)()
+    if scoped.registry.has():  # the session is managed by the outer scope
+        yield scoped()
+        return
+
+    ssn = scoped()
+
+    try:
+        yield ssn
+        ssn.commit()
+
+    except Exception:
+        ssn.rollback()
+        raise
+
+    finally:
+        scoped.remove()
+
+
+def scheduled():
+    """The function of getting the condition of the people who have the events in the schedule table,
+    the rows of the people table are kept after the people are removed from the sheets.
+
+    :return: the EXISTS clause for the people query
+    :rtype: Exists
+    """
+
+    return exists().where(EventDB.person_id == PersonDB.id)
 
 
 def people_from_db(ssn: Session) -> dict:
     """The function of getting a dictionary of people from the people table in the db.
+    Only the people who have the events in the schedule table are taken.
     Structure of the dictionary:
         key - person's db id
         value - the second dictionary
@@ -51,208 +109,430 @@ def people_from_db(ssn: Session) -> dict:
             'first_name': persondb.first_name,
             'last_name': persondb.last_name,
             'chat_id': persondb.tg_chat_id
-        } for persondb in ssn.query(PersonDB)
+        } for persondb in ssn.query(PersonDB).filter(scheduled())
     }
 
 
-def events_from_db(first_name='', last_name='', all=False) -> list:
-    """The function of getting a list of events from the schedule table in the db.
+def schedule(first_name='', last_name='', username='', id=0) -> dict or None:
+    """The function of getting the person with the ordered events of all the events of the bot from the cache or from the db.
+    The texts of the schedule messages are rendered once, when the schedule is read from the db,
+    the rows of every event follow its title if the person works at several events.
+    Structure of the dictionary:
+    {
+        'id': int,
+        'first_name': str,
+        'last_name': str,
+        'tg_username': str,
+        'tg_chat_id': int,
+        'events': list[Event, ...],
+        'messages': list[str, ...]
+    }
 
-    :param first_name: the user's name
+    :param first_name: the user's name or 'По фамилии' to find by the surname only
     :type first_name: str
 
     :param last_name: the user's surname
     :type last_name: str
 
-    :param all: flag to get all people from the db
-    :type all: bool
+    :param username: the user's tg username
+    :type username: str
+
+    :param id: the user's id from the people table
+    :type id: int
 
-    :return: list of the Event objects
-    :rtype: list[Event, ...]
+    :return: the user's schedule or None
+    :rtype: dict | None
     """
 
-    events = []
-    ssn = session()
+    if last_name and first_name == 'По фамилии':
+        key, filters = ('surname', last_name), {'last_name': last_name}
+    elif last_name:
+        key, filters = ('name', first_name, last_name), {'first_name': first_name, 'last_name': last_name}
+    elif username:
+        key, filters = ('username', username), {'tg_username': username}
+    elif id:
+        key, filters = ('id', id), {'id': id}
+    else:
+        return None
 
-    if last_name != '':  # get events for one person only
+    entry = schedules.get(key)
+    if entry:
+        return entry
 
-        if first_name == 'По фамилии':  # get only by surname
-            persondb = ssn.query(PersonDB).filter_by(last_name=last_name).first()
+    token = schedules.token()  # the schedule isn't cached if the updater changes it while it is read
 
-        else:  # get by name and surname
-            persondb = ssn.query(PersonDB).filter_by(last_name=last_name, first_name=first_name).first()
+    with session_scope() as ssn:
+        persondb = ssn.query(PersonDB).filter_by(**filters).first()
 
         if not persondb:
-            return [None]
+            return None
+
+        person = Person(
+            name=persondb.first_name,
+            surname=persondb.last_name,
+            user_name=persondb.tg_username,
+            chat_id=persondb.tg_chat_id
+        )
 
-        events = [
-            Event(
-                name=persondb.first_name,
-                surname=persondb.last_name,
-                user_name=persondb.tg_username,
+        groups = {}  # the person's events by the event id
+        for eventdb in ssn.query(EventDB).filter_by(person_id=persondb.id).order_by(asc(EventDB.start)):
+            groups.setdefault(eventdb.event_id, []).append(Event(
+                person=person,
                 action=eventdb.action,
-                chat_id=persondb.tg_chat_id,
                 start=eventdb.start,
                 end=eventdb.end
-            ) for eventdb in ssn.query(EventDB).filter_by(person_id=persondb.id).order_by(asc(EventDB.start))
-        ]
+            ))
+
+        entry = {
+            'id': persondb.id,
+            'first_name': persondb.first_name,
+            'last_name': persondb.last_name,
+            'tg_username': persondb.tg_username,
+            'tg_chat_id': persondb.tg_chat_id,
+            'events': sorted(event for events in groups.values() for event in events)
+        }
 
-    elif all:  # get all people
+    if len(groups) > 1:
+        titles = {sheet.id: sheet.title for sheet in event_sheets()}
+        entry['messages'] = grouped_messages([(titles.get(event_id, event_id), events) for event_id, events in groups.items()])
+    else:
+        entry['messages'] = schedule_messages(entry['events'])
 
-        data_event = list(
-            {
-                'person_id': eventdb.person_id,
-                'action': eventdb.action,
-                'start': eventdb.start,
-                'end': eventdb.end
-            } for eventdb in ssn.query(EventDB)
+    schedules.put(entry['id'], entry, keys=[
+        key,
+        ('id', entry['id']),
+        ('username', entry['tg_username']),
+        ('name', entry['first_name'], entry['last_name'])
+    ], token=token)
+
+    return entry
+
+
+def events_diff(db_events: dict, new_events: list, people: dict, write, event_id='default') -> tuple:
+    """The function of comparing the current schedule with the parsed one in one pass.
+    The rows to insert and to update are given to the write function by batch_size rows,
+    so only one batch of them is in memory while the events are compared.
+    Structure of the db_events dictionary:
+        key - (person's db id, start of the event)
+        value - (event's db id, action, end of the event)
+
+    :param db_events: current schedule from the db
+    :type db_events: dict
+
+    :param new_events: the Event objects, the EventFeed is iterated once
+    :type new_events: EventFeed | list[Event, ...]
+
+    :param people: dictionary of the people by tg username, every value has the 'id' and 'chat_id' keys
+    :type people: dict
+
+    :param write: function writing the rows, takes the list of the rows in the form of the upsert_events function
+    :type write: function
+
+    :param event_id: id of the event of the bot
+    :type event_id: str
+
+    :return: numbers of the inserted and the updated rows, ids of the events to delete,
+        db ids of the people whose events have changed and messages for each chat id
+    :rtype: tuple[int, int, list[int, ...], set[int, ...], dict]
+    """
+
+    inserts, updates, messages = [], [], {}
+    inserted = updated = 0
+    seen, people_ids = set(), set()
+
+    for event in new_events:
+        person = people[event.user_name]
+        key = (person['id'], event.start)
+
+        if key in seen:  # the same person is in the table twice
+            continue
+        seen.add(key)
+
+        eventdb = db_events.get(key)
+
+        if not eventdb:
+            inserts.append({
+                'event_id': event_id,
+                'person_id': person['id'],
+                'action': event.action,
+                'start': event.start,
+                'end': event.end
+            })
+            people_ids.add(person['id'])
+
+            if len(inserts) == batch_size:
+                write(inserts)
+                inserted += len(inserts)
+                inserts = []
+
+        elif event.action != eventdb[1] or event.end != eventdb[2]:
+            updates.append({
+                'id': eventdb[0],
+                'event_id': event_id,
+                'person_id': person['id'],
+                'action': event.action,
+                'start': event.start,
+                'end': event.end
+            })
+            people_ids.add(person['id'])
+
+            if event.action != eventdb[1]:  # add message to the person
+                messages.setdefault(person['chat_id'], []).append(
+                    f'{event.start.strftime("%H:%M")} - {event.end.strftime("%H:%M")} - {event.action}'
+                )
+
+            if len(updates) == batch_size:
+                write(updates)
+                updated += len(updates)
+                updates = []
+
+    write(inserts)
+    write(updates)
+
+    deletes = []
+    for key, eventdb in db_events.items():
+        if key not in seen:
+            deletes.append(eventdb[0])
+            people_ids.add(key[0])
+
+    return inserted + len(inserts), updated + len(updates), deletes, people_ids, messages
+
+
+def upsert_events(ssn: Session, rows: list) -> None:
+    """The function of inserting events or replacing the action and end of the existing ones.
+    Uses the native INSERT ... ON CONFLICT statement on SQLite and PostgreSQL,
+    the rest of the dialects get the rows with the 'id' key updated and the others inserted.
+    The rows are passed to the statement as they are.
+
+    :param ssn: connected session to db
+    :type ssn: Session
+
+    :param rows: rows with the 'event_id', 'person_id', 'action', 'start' and 'end' keys,
+        the rows of the existing events have the 'id' key too
+    :type rows: list[dict, ...]
+
+    :return: nothing
+    :rtype: None
+    """
+
+    if not rows:
+        return
+
+    dialect = ssn.get_bind().dialect.name
+
+    if dialect in upserts:
+        stmt = upserts[dialect](EventDB.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['event_id', 'person_id', 'start'],
+            set_={
+                'action': stmt.excluded.action,
+                'end': stmt.excluded.end
+            }
         )
+        ssn.execute(stmt, rows)
 
-        data_person = {
-            persondb.id: {
-                'first_name': persondb.first_name,
-                'last_name': persondb.last_name,
-                'chat_id': persondb.tg_chat_id
-            } for persondb in ssn.query(PersonDB)
-        }
+    else:
+        ssn.bulk_insert_mappings(EventDB, [row for row in rows if 'id' not in row])
+        ssn.bulk_update_mappings(EventDB, [row for row in rows if 'id' in row])
+
+
+def people_to_db(ssn: Session, new_events: list) -> tuple:
+    """The function of adding the new people of the events and renaming the changed ones by bulk statements.
+    The new people are inserted by one statement and their ids are read by one query,
+    the people added by another event at the same time are skipped on SQLite and PostgreSQL.
+    Structure of the people dictionary:
+        key - tg username
+        value - {'id': int, 'current_action': str, 'chat_id': int}
+
+    :param ssn: connected session to db
+    :type ssn: Session
+
+    :param new_events: the Event objects, one event of every person is enough
+    :type new_events: list[Event, ...]
 
-        for event in data_event:
-            new_event = Event(
-                name=data_person[event['person_id']]['first_name'],
-                surname=data_person[event['person_id']]['last_name'],
-                chat_id=data_person[event['person_id']]['chat_id'],
-                action=event['action'],
-                start=event['start'],
-                end=event['end']
-            )
-            events.append(new_event)
+    :return: dictionary of the people, names of the added people and of the renamed people by the db id
+    :rtype: tuple[dict, dict, dict]
+    """
+
+    sheet = {}  # the name, surname and first action by tg username
+    for event in new_events:
+        if event.user_name not in sheet:
+            sheet[event.user_name] = (event.name, event.surname, event.action)
+
+    people, names_db = {}, {}
+    for id, username, first_name, last_name, action, chat_id in ssn.query(
+            PersonDB.id, PersonDB.tg_username, PersonDB.first_name, PersonDB.last_name,
+            PersonDB.current_action, PersonDB.tg_chat_id
+    ):
+        people[username] = {'id': id, 'current_action': action, 'chat_id': chat_id}
+        names_db[username] = (first_name, last_name)
+
+    new = [username for username in sheet if username not in people]
+    added, renamed = {}, {}
+
+    if new:
+        rows = [
+            {
+                'first_name': sheet[username][0],
+                'last_name': sheet[username][1],
+                'tg_chat_id': 0,
+                'tg_username': username,
+                'current_action': sheet[username][2]
+            } for username in new
+        ]
+
+        dialect = ssn.get_bind().dialect.name
+        if dialect in upserts:
+            ssn.execute(upserts[dialect](PersonDB.__table__).on_conflict_do_nothing(index_elements=['tg_username']), rows)
+        else:
+            ssn.execute(PersonDB.__table__.insert(), rows)
+
+        for id, username, action, chat_id in ssn.query(
+                PersonDB.id, PersonDB.tg_username, PersonDB.current_action, PersonDB.tg_chat_id
+        ).filter(PersonDB.tg_username.in_(new)):
+            people[username] = {'id': id, 'current_action': action, 'chat_id': chat_id}
+            added[id] = sheet[username][:2]
+
+    for username, (first_name, last_name) in names_db.items():
+        if username in sheet and sheet[username][:2] != (first_name, last_name):
+            renamed[people[username]['id']] = sheet[username][:2]
 
-    return events
+    if renamed:
+        ssn.bulk_update_mappings(PersonDB, [
+            {'id': id, 'first_name': first_name, 'last_name': last_name}
+            for id, (first_name, last_name) in renamed.items()
+        ])
 
+    return people, added, renamed
 
-def events_to_db(new_events: list) -> dict:
-    """The function of updating the schedule table in the database and
+
+def events_to_db(new_events: list, changed=None, removed=(), event_id='default', touched=None) -> dict:
+    """The function of updating the schedule table of the event in the database and
     getting a dictionary of messages about all changes in the schedule for each user id.
+    The people and the events are updated by bulk statements in one transaction:
+    the new and renamed people first, then the current schedule is loaded once and compared with the parsed one,
+    the changed events are written by batches while the feed is compared.
+    If the changed people are passed, only their events are compared and the rest of the table is left as is,
+    otherwise the whole schedule of the event is compared and the people missing in the parsed one are removed.
     Structure of the dictionary:
         key - chat id
         value - list of the changes
     Example of the element in the list:
         '09:00 - 09:00 - Action'
 
-    :param new_events: list of the Event objects
-    :type new_events: list[Event, ...]
+    :param new_events: the EventFeed or list of the Event objects
+    :type new_events: EventFeed | list[Event, ...]
+
+    :param changed: tg usernames of the people whose events are passed, all the people of the event if None
+    :type changed: set | None
+
+    :param removed: tg usernames of the people whose events should be deleted
+    :type removed: set
+
+    :param event_id: id of the event of the bot
+    :type event_id: str
+
+    :param touched: the set getting the db ids of the people whose schedules or names have been changed
+    :type touched: set | None
 
     :return: dictionary of messages for each user id
     :rtype: dict
     """
 
-    messages = {}
+    if not new_events and not removed:  # the table wasn't parsed, nothing to compare with
+        return {}
 
-    ssn = session()
-    db_events = events_from_db(all=True)
-    people = {
-        persondb.tg_username: {
-            'id': persondb.id,
-            'current_action': persondb.current_action
-        } for persondb in ssn.query(PersonDB)
-    }
+    start = time.perf_counter()
 
-    for event in new_events:
-        if f'{event.user_name}' not in people.keys():  # add new person to the db
-            new_person = PersonDB(
-                first_name=event.name,
-                last_name=event.surname,
-                tg_username=event.user_name,
-                current_action=event.action
-            )
-            ssn.add(new_person)
-            ssn.commit()
-            people[f'{event.user_name}'] = {
-                'id': new_person.id,
-                'current_action': event.action
-            }
+    # one event of every person is enough to know the people, the feed makes the rest of them only for the diff
+    first_events = list(new_events.first_events()) if isinstance(new_events, EventFeed) else new_events
 
-        elif event.action != people[event.user_name]['current_action'] and abs(
-                (event.start - datetime.now()).days * 24 * 60 + (event.start - datetime.now()).seconds / 60 - 60) < 10:
-
-            persondb = ssn.query(PersonDB).filter_by(tg_username=event.user_name).first()
-            if persondb.tg_chat_id not in messages.keys():
-                messages[persondb.tg_chat_id] = []
-            messages[persondb.tg_chat_id].append(f'Смена деятельности:\n'
-                                                 f'С {event.start} - {event.action}')
-
-            persondb.current_action = event.action
-
-            ssn.commit()
-
-        if not db_events:  # if db is empty
-            new_event_db = EventDB(
-                person_id=people[f'{event.user_name}']['id'],
-                action=event.action,
-                start=event.start,
-                end=event.end
-            )
-            ssn.add(new_event_db)
-
-        else:  # update event from db
-            eventdb = ssn.query(EventDB).filter_by(
-                person_id=people[event.user_name]['id'],
-                start=event.start,
-            ).first()
-
-            if event and eventdb and event.action != eventdb.action:
-                eventdb.action = event.action  # change the action
-
-                # add message to the person
-                person_tg_chat_id = ssn.query(PersonDB.tg_chat_id).filter_by(id=eventdb.person_id).first()[0]
-                if person_tg_chat_id not in messages.keys():
-                    messages[person_tg_chat_id] = []
-                messages[person_tg_chat_id].append(
-                    f'{eventdb.start.strftime("%H:%M")} - {eventdb.end.strftime("%H:%M")} - {eventdb.action}'
-                )
+    with session_scope() as ssn:
+        people, added, renamed = people_to_db(ssn, first_events)
 
-    ssn.commit()
+        query = ssn.query(EventDB.id, EventDB.person_id, EventDB.action, EventDB.start, EventDB.end).filter_by(event_id=event_id)
+        if changed is not None:
+            query = query.filter(EventDB.person_id.in_(
+                [people[username]['id'] for username in changed if username in people]
+            ))
 
-    return messages
+        db_events = {
+            (person_id, start): (id, action, end)
+            for id, person_id, action, start, end in query
+        }
 
+        writing = 0.0  # the batches are written while the events are compared
 
-def person(first_name='', last_name='', chat_id=0, username='', id=0) -> dict or None:
-    """The function of getting user's name, surname and tg chat id from the db.
+        def write(rows: list) -> None:
+            nonlocal writing
+            written = time.perf_counter()
+            upsert_events(ssn, rows)
+            writing += time.perf_counter() - written
 
-    :param first_name: the user's name
-    :type first_name: str
+        inserted, updated, deletes, people_ids, messages = events_diff(db_events, new_events, people, write, event_id)
 
-    :param last_name: the user's surname
-    :type last_name: str
+        diffed = time.perf_counter()
+        metrics.update_stage_seconds.observe(diffed - start - writing, stage='diff', event=event_id)
 
-    :param chat_id: the user's tg chat id
-    :type chat_id: int
+        removed_ids = {people[username]['id'] for username in removed if username in people}
+        if changed is None:  # the people of the event who aren't in the table anymore
+            sheet_ids = {people[event.user_name]['id'] for event in first_events}
+            removed_ids |= {person_id for person_id, start in db_events} - sheet_ids
+
+        if removed_ids:
+            ssn.query(EventDB).filter_by(event_id=event_id).filter(EventDB.person_id.in_(list(removed_ids))).delete(synchronize_session=False)
+        if deletes:
+            ssn.query(EventDB).filter(EventDB.id.in_(deletes)).delete(synchronize_session=False)
+
+        # the people removed from this event may still work at the others
+        remaining = {
+            person_id for person_id, in ssn.query(EventDB.person_id).filter(EventDB.person_id.in_(list(removed_ids))).distinct()
+        } if removed_ids else set()
+
+    metrics.update_stage_seconds.observe(time.perf_counter() - diffed + writing, stage='commit', event=event_id)
+    metrics.events_changed.inc(inserted, kind='insert', event=event_id)
+    metrics.events_changed.inc(updated, kind='update', event=event_id)
+    metrics.events_changed.inc(len(deletes), kind='delete', event=event_id)
+
+    for person_id, (first_name, last_name) in {**added, **renamed}.items():
+        names.index.add(person_id, first_name, last_name)
+
+    # the organizers of the changed rows are authorized, the ones removed from every event aren't and aren't searched
+    for username in {event.user_name for event in first_events}:
+        auth.users.add(people[username]['id'], username, people[username]['chat_id'])
+    for person_id in removed_ids - remaining:
+        auth.users.remove(person_id)
+        names.index.remove(person_id)
+
+    # the cached schedules of the people with changed events are read from the db again
+    people_ids |= removed_ids | set(added) | set(renamed)
+    schedules.invalidate(people_ids)
+
+    if touched is not None:
+        touched |= people_ids
+
+    return messages
+
+
+def current_action(username: str, action: str) -> int:
+    """The function of updating the person's current action in the db.
 
     :param username: the user's tg username
     :type username: str
 
-    :param id: the user's id from the people table
-    :type id: int
+    :param action: the new action
+    :type action: str
 
-    :return: the user's characteristics or None
-    :rtype: dict | None
+    :return: the user's tg chat id or 0 if the action is the same
+    :rtype: int
     """
 
-    ssn = session()
-
-    if first_name and last_name:
-        persondb = ssn.query(PersonDB).filter_by(first_name=first_name, last_name=last_name).first()
-    elif username:
+    with session_scope() as ssn:
         persondb = ssn.query(PersonDB).filter_by(tg_username=username).first()
-    elif id:
-        persondb = ssn.query(PersonDB).filter_by(id=id).first()
-    elif chat_id:
-        persondb = ssn.query(PersonDB).filter_by(tg_chat_id=chat_id).first()
-    else:
-        return None
 
-    return {
-        'first_name': persondb.first_name,
-        'last_name': persondb.last_name,
-        'tg_chat_id': persondb.tg_chat_id
-    }
+        if not persondb or persondb.current_action == action:
+            return 0
+
+        persondb.current_action = action
+
+        return persondb.tg_chat_id
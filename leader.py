@@ -0,0 +1,389 @@
+"""The leader election of the bot replicas.
+
+Every replica serves the handlers, only the holder of the lease row runs the updater.
+Two replicas on one db:
+
+    python leader.py  # in two terminals, stop the leader with Ctrl+C or kill -9 to see the failover
+
+"""
+
+import configDB
+import get
+import auth
+import names
+from create import ChangeDB, LeaseDB, PersonDB
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from threading import Event, Lock, Thread
+from datetime import datetime, timedelta
+import os
+import socket
+import time
+import uuid
+import logging
+
+# Connect logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+lease_seconds = getattr(configDB, 'lease_seconds', 30)  # the longest time without the leader
+changes_kept = getattr(configDB, 'changes_kept', 1000)  # the replica behind by more revisions reloads all the caches
+
+
+def replica_id() -> str:
+    """The function of creating the id of the replica.
+
+    :return: the host name, the process id and a random suffix
+    :rtype: str
+    """
+
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+
+
+def reload_caches() -> None:
+    """The function of reading the organizers and the names of the people from the db again.
+    Only the people who have the events in the schedule are read, the ones removed from the sheets aren't.
+    The new caches replace the old ones at once and the cached schedules are dropped.
+
+    :return: nothing
+    :rtype: None
+    """
+
+    users = auth.AuthCache()
+    index = names.NameIndex()
+
+    with get.session_scope() as ssn:
+        users.load(
+            (persondb.id, persondb.tg_username, persondb.tg_chat_id)
+            for persondb in ssn.query(PersonDB).filter(get.scheduled())
+        )  # the organizers, the ones who wrote to the bot are authorized by the chat id
+
+        index.load(get.people_from_db(ssn))  # the people for the search by the inexact name
+
+    auth.users, names.index = users, index
+    get.schedules.clear()
+
+
+def reload_people(person_ids: set) -> None:
+    """The function of reading the changed people from the db again.
+    Only the organizers, the names and the cached schedules of these people are replaced,
+    the people without the events in the schedule are removed from the caches.
+
+    :param person_ids: db ids of the changed people
+    :type person_ids: set[int, ...]
+
+    :return: nothing
+    :rtype: None
+    """
+
+    with get.session_scope() as ssn:
+        people = {
+            persondb.id: (persondb.tg_username, persondb.tg_chat_id, persondb.first_name, persondb.last_name)
+            for persondb in ssn.query(PersonDB).filter(PersonDB.id.in_(person_ids), get.scheduled())
+        }
+
+    for person_id in person_ids:
+        if person_id in people:
+            username, chat_id, first_name, last_name = people[person_id]
+            auth.users.add(person_id, username, chat_id)
+            names.index.add(person_id, first_name, last_name)
+
+        else:  # the person has been removed from the sheets
+            auth.users.remove(person_id)
+            names.index.remove(person_id)
+
+    get.schedules.invalidate(person_ids)
+
+
+class Lease:
+    """The object takes and renews the lease row in the db.
+    The row is updated only if it is expired or held by this replica, so one replica holds it at a time.
+    The clocks of the replicas are expected to be synchronized.
+
+    name - name of the lease row
+    holder - id of this replica
+    length - how long the lease is valid after the renewal
+
+    """
+
+    def __init__(self,
+                 name='updater',
+                 holder=None,
+                 length=timedelta(seconds=lease_seconds * 2 / 3)
+                 ):
+        self.name = name
+        self.holder = holder or replica_id()
+        self.length = length
+
+    def __repr__(self):
+        return f'<Lease(name="{self.name}", holder="{self.holder}", length="{self.length}")>'
+
+    def acquire(self) -> bool:
+        """The function of taking or renewing the lease.
+
+        :return: True if this replica holds the lease
+        :rtype: bool
+        """
+
+        now = datetime.utcnow()
+
+        with get.session_scope() as ssn:
+            taken = ssn.query(LeaseDB).filter(
+                LeaseDB.name == self.name,
+                or_(LeaseDB.holder == self.holder, LeaseDB.expires < now)
+            ).update({'holder': self.holder, 'expires': now + self.length}, synchronize_session=False)
+
+            if taken:
+                return True
+
+            if ssn.query(LeaseDB.name).filter_by(name=self.name).first():  # held by another replica
+                return False
+
+        try:
+            with get.session_scope() as ssn:
+                ssn.add(LeaseDB(name=self.name, holder=self.holder, expires=now + self.length))
+
+        except IntegrityError:  # another replica has added the row first
+            return False
+
+        return True
+
+    def release(self) -> None:
+        """The function of giving the lease away, another replica takes it on its next heartbeat.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with get.session_scope() as ssn:
+            ssn.query(LeaseDB).filter_by(name=self.name, holder=self.holder).update(
+                {'expires': datetime.utcnow()}, synchronize_session=False
+            )
+
+    def revision(self) -> int or None:
+        """The function of getting the number of the db changes.
+
+        :return: the revision or None if there is no lease row yet
+        :rtype: int | None
+        """
+
+        with get.session_scope() as ssn:
+            row = ssn.query(LeaseDB.revision).filter_by(name=self.name).first()
+
+        return row[0] if row else None
+
+    def bump(self, person_ids=()) -> int or None:
+        """The function of increasing the number of the db changes and writing the changed people of the new revision.
+        The changes older than changes_kept revisions are deleted.
+
+        :param person_ids: db ids of the changed people
+        :type person_ids: Iterable[int]
+
+        :return: the new revision or None if there is no lease row yet
+        :rtype: int | None
+        """
+
+        with get.session_scope() as ssn:
+            ssn.query(LeaseDB).filter_by(name=self.name).update(
+                {'revision': LeaseDB.revision + 1}, synchronize_session=False
+            )
+            row = ssn.query(LeaseDB.revision).filter_by(name=self.name).first()
+
+            if row:
+                ssn.query(ChangeDB).filter(ChangeDB.revision <= row[0] - changes_kept).delete(synchronize_session=False)
+                ssn.merge(ChangeDB(revision=row[0], person_ids=','.join(f'{person_id}' for person_id in sorted(person_ids))))
+
+        return row[0] if row else None
+
+    def changes(self, after: int, revision: int) -> set or None:
+        """The function of getting the people changed after the known revision.
+
+        :param after: the known revision
+        :type after: int
+
+        :param revision: the current revision
+        :type revision: int
+
+        :return: db ids of the changed people or None if some of the revisions aren't in the changes table
+        :rtype: set[int, ...] | None
+        """
+
+        if revision < after:  # the lease row has been made again
+            return None
+
+        with get.session_scope() as ssn:
+            rows = ssn.query(ChangeDB.person_ids).filter(ChangeDB.revision > after, ChangeDB.revision <= revision).all()
+
+        if len(rows) != revision - after:
+            return None
+
+        return {int(person_id) for person_ids, in rows for person_id in person_ids.split(',') if person_id}
+
+
+class Election:
+    """The object keeps the lease by the heartbeat thread and tells if this replica is the leader.
+    The lease is renewed three times per its period, so a new leader is elected within lease_seconds
+    after the old one has stopped. The leader steps down as soon as its last renewal may have expired.
+    Every replica refreshes the people changed by another replica in its caches,
+    all the caches are reloaded only if the changes of some revisions are missing.
+
+    lease - the Lease object
+    interval - time between the heartbeats in seconds
+    reload - function reloading the caches
+    refresh - function reloading the changed people, takes their db ids
+    leading - True if this replica was the leader on the last heartbeat
+    valid_until - monotonic time until this replica is surely the leader
+    revision - the last known number of the db changes
+
+    """
+
+    def __init__(self,
+                 lease=None,
+                 interval=lease_seconds / 3,
+                 reload=reload_caches,
+                 refresh=reload_people
+                 ):
+        self.lease = lease or Lease()
+        self.interval = interval
+        self.reload = reload
+        self.refresh = refresh
+        self.leading = False
+        self.valid_until = 0.0
+        self.revision = None
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+
+    def __repr__(self):
+        return f'<Election(holder="{self.lease.holder}", leading="{self.is_leader()}", revision="{self.revision}")>'
+
+    def is_leader(self) -> bool:
+        """The function of checking if this replica should run the updater.
+
+        :return: True if this replica holds the lease
+        :rtype: bool
+        """
+
+        with self.lock:
+            return time.monotonic() < self.valid_until
+
+    def start(self) -> None:
+        """The function of launching the heartbeat thread, the first heartbeat is done at once.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        self.stopped.clear()
+        self.beat()
+
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """The function of stopping the heartbeat and giving the lease away.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+
+        with self.lock:
+            self.valid_until = 0.0
+
+        if self.leading:
+            self.lease.release()
+            self.leading = False
+
+    def run(self) -> None:
+        """The function of the heartbeat thread.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        while not self.stopped.wait(self.interval):
+            self.beat()
+
+    def beat(self) -> None:
+        """The function of renewing the lease and refreshing the caches if the db has been changed by another replica.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        started = time.monotonic()
+
+        try:
+            leading = self.lease.acquire()
+
+        except Exception as e:  # the lease can't be renewed, another replica may take it
+            print(f'{datetime.now()} - bot.leader.Election.beat - {e}')
+            leading = False
+
+        with self.lock:
+            self.valid_until = started + self.lease.length.total_seconds() if leading else 0.0
+
+        if leading != self.leading:
+            print(f'{datetime.now()} - bot.leader.Election.beat - {self.lease.holder} is the {"leader" if leading else "follower"}')
+            self.leading = leading
+
+        try:
+            revision = self.lease.revision()
+
+            with self.lock:
+                known, self.revision = self.revision, revision
+
+            if revision is not None and known is not None and revision != known:
+                person_ids = self.lease.changes(known, revision)
+
+                if person_ids is None:
+                    self.reload()
+                else:
+                    self.refresh(person_ids)
+
+        except Exception as e:
+            print(f'{datetime.now()} - bot.leader.Election.beat - {e}')
+
+    def changed(self, person_ids=()) -> None:
+        """The function of telling the other replicas which people have been changed in the db.
+
+        :param person_ids: db ids of the changed people
+        :type person_ids: Iterable[int]
+
+        :return: nothing
+        :rtype: None
+        """
+
+        try:
+            revision = self.lease.bump(person_ids)
+
+        except Exception as e:
+            print(f'{datetime.now()} - bot.leader.Election.changed - {e}')
+            return
+
+        with self.lock:
+            if revision is not None and self.revision is not None and revision == self.revision + 1:
+                self.revision = revision  # only this replica has changed the db since the last heartbeat
+
+
+election = Election()  # the election of this replica, started by main
+
+
+if __name__ == '__main__':
+    election.start()
+    print(f'{datetime.now()} - bot.leader - {election.lease.holder} started')
+
+    try:
+        while True:
+            time.sleep(1)
+
+    except KeyboardInterrupt:
+        election.stop()
+        print(f'{datetime.now()} - bot.leader - {election.lease.holder} stopped')
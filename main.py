@@ -1,11 +1,16 @@
+import configBot
 from configBot import token
-import telebot
 from telebot import types
-import get, update
+import get, update, names, auth
+from pool import PooledTeleBot, timed
+import webhook
+import metrics
+import leader
+import snapshot
+from urllib.parse import urlparse
 from datetime import datetime
 from threading import Thread
 import logging
-from create import PersonDB
 
 # Connect logging
 logging.basicConfig(
@@ -14,11 +19,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-bot = telebot.TeleBot(token)  # connection to the tg bot
+bot = PooledTeleBot(token, workers=getattr(configBot, 'workers', 8))  # connection to the tg bot
 
-logged_users = set(
-    persondb.tg_username for persondb in get.session().query(PersonDB).filter(PersonDB.tg_chat_id != 0).all()
-)  # list of users who wrote to the bot and is the organizer
+if not snapshot.restore():  # the caches of the last run, they are read from the db if there is no snapshot
+    leader.reload_caches()  # the organizers and the people for the search by the inexact name
 
 
 class User:
@@ -44,9 +48,10 @@ class User:
 
 
 @bot.message_handler(commands=['start'])
+@timed
 def start(message: types.Message) -> None:
     """The function is the handler of the start command.
-    Checks if the user is the organizer.
+    Checks if the user is the organizer, the users who aren't in the auth cache are refused without the db.
 
     :param message: the received message from tg
     :type message: types.Message
@@ -56,10 +61,10 @@ def start(message: types.Message) -> None:
     """
 
     try:
-        if message.chat.username not in logged_users:
-            if update.tg_chat_id(username=message.chat.username, chat_id=message.chat.id):
-                logged_users.add(message.chat.username)
+        if not auth.users.is_authorized(message.chat.id):
+            organizer = auth.users.organizer(message.chat.username) is not None
 
+            if organizer and update.tg_chat_id(username=message.chat.username, chat_id=message.chat.id):
                 bot.send_message(
                     chat_id=message.chat.id,
                     text='Авторизация прошла успешно.\n'
@@ -87,6 +92,7 @@ def start(message: types.Message) -> None:
 
 
 @bot.message_handler(commands=['help'])
+@timed
 def help_command(message: types.Message) -> None:
     """The function is the handler of the help command.
 
@@ -99,7 +105,7 @@ def help_command(message: types.Message) -> None:
 
     try:
 
-        if message.chat.username in logged_users:
+        if auth.users.is_authorized(message.chat.id):
             text = '/myschedule - мое расписание\n' \
                    '/start - авторизоваться\n' \
                    '/schedule - чужое расписание\n' \
@@ -118,6 +124,7 @@ def help_command(message: types.Message) -> None:
 
 
 @bot.message_handler(commands=['myschedule'])
+@timed
 def my_schedule(message: types.Message) -> None:
     """The function is the handler of the my schedule command.
 
@@ -128,9 +135,11 @@ def my_schedule(message: types.Message) -> None:
     :rtype: None
     """
     try:
-        if message.chat.username in logged_users:
-            person = get.person(username=message.chat.username)
-            send_schedule(message=message, my=True, first_name=person['first_name'], last_name=person['last_name'])
+        if auth.users.is_authorized(message.chat.id):
+            entry = get.schedule(id=auth.users.person_id(message.chat.id))
+
+            for message_text in entry['messages']:
+                bot.send_message(message.chat.id, message_text)
 
         else:
             bot.send_message(
@@ -145,6 +154,7 @@ def my_schedule(message: types.Message) -> None:
 
 
 @bot.message_handler(commands=['schedule'])
+@timed
 def choice_way_to_to_get_schedule(message: types.Message) -> None:
     """The function is the handler of the schedule command.
 
@@ -156,7 +166,7 @@ def choice_way_to_to_get_schedule(message: types.Message) -> None:
     """
 
     try:
-        if message.chat.username in logged_users:
+        if auth.users.is_authorized(message.chat.id):
             buttons = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
 
             surname = types.KeyboardButton('По фамилии')
@@ -184,6 +194,7 @@ def choice_way_to_to_get_schedule(message: types.Message) -> None:
 
 
 @bot.message_handler(content_types=['text'])
+@timed
 def handler(message: types.Message) -> None:
     """The function is the handler of the text.
     React to the following phrases:
@@ -198,7 +209,7 @@ def handler(message: types.Message) -> None:
     :rtype: None
     """
 
-    if message.chat.username in logged_users:
+    if auth.users.is_authorized(message.chat.id):
 
         if message.text == 'По фамилии':
             invite_write_surname(message)
@@ -217,6 +228,7 @@ def handler(message: types.Message) -> None:
         )
 
 
+@timed
 def invite_write_name(message: types.Message) -> None:
     """The function of inviting the user to write his name.
     The next step is to invite to write his surname.
@@ -236,6 +248,7 @@ def invite_write_name(message: types.Message) -> None:
         print(f'{datetime.now()} - bot.main.invite_write_name - {e}')
 
 
+@timed
 def invite_write_surname(message: types.Message) -> None:
     """The function of inviting the user to write his surname.
     The next step is to send the schedule from the database by received data.
@@ -257,6 +270,7 @@ def invite_write_surname(message: types.Message) -> None:
         print(f'{datetime.now()} - bot.main.invite_write_surname - {e}')
 
 
+@timed
 def send_schedule(message: types.Message, first_name: str, my=False, last_name='') -> None:
     """The function of sending the schedule from the db.
 
@@ -280,77 +294,132 @@ def send_schedule(message: types.Message, first_name: str, my=False, last_name='
         if not my:
             last_name = message.text
 
-        events = get.events_from_db(first_name, last_name)
+        entry = get.schedule(first_name=first_name, last_name=last_name)
+
+        if not entry:  # try to find the person by the inexact name
+            query = last_name if first_name == 'По фамилии' else f'{first_name} {last_name}'
+            candidates = names.index.search(query)
 
-        message_text = ''
-        rows = []
+            if len(candidates) == 1 or candidates and candidates[0][0] == 2.0 and candidates[1][0] < 2.0:
+                entry = get.schedule(id=candidates[0][1])
+
+            elif candidates:
+                buttons = types.InlineKeyboardMarkup()
+                for score, person_id, candidate_first_name, candidate_last_name in candidates:
+                    buttons.add(types.InlineKeyboardButton(
+                        text=f'{candidate_last_name} {candidate_first_name}',
+                        callback_data=f'schedule:{person_id}'
+                    ))
 
-        if events:  # create rows of events by list of events
-            if not events[0]:
                 bot.send_message(
                     chat_id=message.chat.id,
-                    text='Пользователь не найден'
+                    text='Пользователь не найден. Возможно, ты искал:',
+                    reply_markup=buttons
                 )
                 return
 
-            current_action = events[0].action
-            current_start = events[0].start
-            current_end = events[0].end
+        if not entry:
+            bot.send_message(
+                chat_id=message.chat.id,
+                text='Пользователь не найден'
+            )
+            return
 
-            for event in events[1:]:
-                if current_action == event.action:
-                    current_end = event.end
+        for message_text in entry['messages']:  # the messages are rendered when the schedule changes
+            bot.send_message(message.chat.id, message_text)
 
-                else:
-                    rows.append(
-                        f'{current_start.strftime("%H:%M")} - {current_end.strftime("%H:%M")} - {current_action}')
-                    current_action = event.action
-                    current_start = event.start
-                    current_end = event.end
+    except Exception as e:
+        print(f'{datetime.now()} - bot.main.send_schedule - {e}')
 
-            rows.append(f'{current_start.strftime("%H:%M")} - ... - {current_action}')
 
-            message_text = '\n'.join(rows)
+@bot.callback_query_handler(func=lambda call: call.data.startswith('schedule:'))
+@timed
+def send_found_schedule(call: types.CallbackQuery) -> None:
+    """The function is the handler of the button with the found person.
+    Sends the schedule of the person.
 
-        if message_text:  # create and send messages by rows of events
-            nrows = 70
-            if len(rows) > nrows:  # if the message length is too long
-                i = 0
+    :param call: the received callback query from telegram
+    :type call: types.CallbackQuery
 
-                message_text = '\n'.join(rows[i: i + nrows])
+    :return: nothing
+    :rtype: None
+    """
 
-                while i < len(rows) + nrows and message_text:
-                    bot.send_message(message.chat.id, message_text)
+    try:
+        bot.answer_callback_query(call.id)
 
-                    i += nrows
-                    message_text = '\n'.join(rows[i: i + nrows])
+        if auth.users.is_authorized(call.message.chat.id):
+            entry = get.schedule(id=int(call.data.split(':')[1]))
 
-            else:
-                bot.send_message(message.chat.id, message_text)
+            for message_text in entry['messages'] if entry else ['Пользователь не найден']:
+                bot.send_message(call.message.chat.id, message_text)
 
         else:
-            message_text = 'Ивентов не найдено.'
-            bot.send_message(message.chat.id, message_text)
+            bot.send_message(
+                chat_id=call.message.chat.id,
+                text='К сожалению, ты не организатор данного мероприятия.\n'
+                     'Попробуй вновь написать команду /start.\n'
+                     'Если произошла ошибка, напиши об этом руководству.'
+            )
 
     except Exception as e:
-        print(f'{datetime.now()} - bot.main.send_schedule - {e}')
+        print(f'{datetime.now()} - bot.main.send_found_schedule - {e}')
 
 
 def main() -> None:
     """The main function.
     Launches bot and parsing.
+    The bot gets the updates by the long polling or, if the mode in the config is 'webhook',
+    by the local HTTP server behind the webhook url, the webhook mode needs the webhook_secret in the config.
+    The metrics are served on the local port from the config, 0 turns them off,
+    every replica on one host needs its own port, the replica that can't take the port runs without the metrics.
+    Every replica of the bot serves the handlers, the parsing runs only on the elected leader.
 
     :return: nothing
     :rtype: None
     """
 
-    bot_thread = Thread(target=bot.polling)
+    if getattr(configBot, 'mode', 'polling') == 'webhook':
+        url = configBot.webhook_url
+        secret = getattr(configBot, 'webhook_secret', '')  # required, the server isn't started without it
+
+        server = webhook.server(
+            bot,
+            secret,
+            host=getattr(configBot, 'webhook_host', '127.0.0.1'),
+            port=getattr(configBot, 'webhook_port', 8443),
+            path=urlparse(url).path or '/'
+        )
+
+        bot.remove_webhook()
+        bot.set_webhook(url=url, secret_token=secret)
+
+        bot_thread = Thread(target=server.serve_forever)
+
+    else:
+        bot.remove_webhook()
+        bot_thread = Thread(target=bot.polling)
+
     bot_thread.start()
     print(f'{datetime.now()} - bot.main - bot launched successfully')
 
+    leader.election.start()
+    print(f'{datetime.now()} - bot.main - {leader.election.lease.holder} joined the election')
+
     parser = Thread(target=update.database, args=(bot,))
     parser.start()
     print(f'{datetime.now()} - bot.main - parser launched successfully')
 
+    metrics_port = getattr(configBot, 'metrics_port', 9108)
+    if metrics_port:
+        try:
+            metrics_server = metrics.server(host=getattr(configBot, 'metrics_host', '127.0.0.1'), port=metrics_port)
+        except OSError as e:  # the port is taken by another replica on the host, the bot works without the metrics
+            print(f'{datetime.now()} - bot.main - metrics on the port {metrics_port} - {e}')
+        else:
+            Thread(target=metrics_server.serve_forever, daemon=True).start()
+            print(f'{datetime.now()} - bot.main - metrics launched successfully')
+
 
-main()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+from threading import Lock
+from datetime import datetime
+import time
+import logging
+
+# Connect logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # seconds
+
+
+def escape(value) -> str:
+    """The function of escaping the label value for the Prometheus text format.
+
+    :param value: the label value
+    :type value: Any
+
+    :return: the escaped value
+    :rtype: str
+    """
+
+    return f'{value}'.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def labels_text(labels: tuple) -> str:
+    """The function of writing the labels of the sample.
+
+    :param labels: the labels as sorted (name, value) pairs
+    :type labels: tuple[tuple[str, Any], ...]
+
+    :return: the labels in braces or an empty string
+    :rtype: str
+    """
+
+    if not labels:
+        return ''
+
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+
+class Metric:
+    """The object is a metric with the values by the labels.
+
+    name - the metric name
+    help - the description of the metric
+    kind - the Prometheus type of the metric
+    values - the values by the sorted (name, value) label pairs
+
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = Lock()
+
+    def __repr__(self):
+        return f'<{type(self).__name__}(name="{self.name}", series="{len(self.values)}")>'
+
+    def value(self, **labels) -> float:
+        """The function of getting the current value of the series.
+
+        :return: the value, 0 if the series hasn't been written
+        :rtype: float
+        """
+
+        with self.lock:
+            return self.values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self) -> list:
+        """The function of getting the samples of the metric.
+
+        :return: the samples as (name, labels, value)
+        :rtype: list[tuple[str, tuple, float], ...]
+        """
+
+        with self.lock:
+            return [(self.name, labels, value) for labels, value in self.values.items()]
+
+    def render(self) -> str:
+        """The function of writing the metric in the Prometheus text format.
+
+        :return: the text of the metric
+        :rtype: str
+        """
+
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(f'{name}{labels_text(labels)} {value}' for name, labels, value in self.samples())
+
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(Metric):
+    """The metric that only goes up."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels) -> None:
+        """The function of increasing the counter.
+
+        :param amount: the increase, not negative
+        :type amount: int | float
+
+        :return: nothing
+        :rtype: None
+        """
+
+        key = tuple(sorted(labels.items()))
+
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    """The metric that goes up and down."""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels) -> None:
+        """The function of setting the gauge.
+
+        :param value: the new value
+        :type value: int | float
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+
+class Histogram(Metric):
+    """The metric counting the observations in the buckets.
+
+    buckets - the upper bounds of the buckets
+    values - [bucket counters, sum, count] by the labels
+
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets=BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        """The function of adding the observation.
+
+        :param value: the observed value
+        :type value: float
+
+        :return: nothing
+        :rtype: None
+        """
+
+        key = tuple(sorted(labels.items()))
+
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """The context manager observing the duration of its block in seconds."""
+
+        start = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def value(self, **labels) -> float:
+        """The function of getting the number of the observations of the series.
+
+        :return: the number of the observations
+        :rtype: int
+        """
+
+        with self.lock:
+            series = self.values.get(tuple(sorted(labels.items())))
+
+        return series[2] if series else 0
+
+    def samples(self) -> list:
+        samples = []
+
+        with self.lock:
+            for labels, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, number in zip(self.buckets, counts):
+                    cumulative += number
+                    samples.append((f'{self.name}_bucket', labels + (('le', bound),), cumulative))
+
+                samples.append((f'{self.name}_bucket', labels + (('le', '+Inf'),), count))
+                samples.append((f'{self.name}_sum', labels, total))
+                samples.append((f'{self.name}_count', labels, count))
+
+        return samples
+
+
+class Registry:
+    """The object keeps the metrics of the bot.
+
+    metrics - the metrics by the name
+    collectors - the functions called before the rendering to refresh the gauges
+
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.lock = Lock()
+
+    def __repr__(self):
+        return f'<Registry(metrics="{len(self.metrics)}", collectors="{len(self.collectors)}")>'
+
+    def register(self, metric: Metric) -> Metric:
+        """The function of adding the metric, the metric with the same name is returned if it exists.
+
+        :param metric: the metric
+        :type metric: Metric
+
+        :return: the registered metric
+        :rtype: Metric
+        """
+
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.register(Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self.register(Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets=BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, buckets))
+
+    def collect(self, collector) -> None:
+        """The function of adding the function refreshing the gauges before the rendering.
+
+        :param collector: the function without arguments
+        :type collector: Callable
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.lock:
+            self.collectors.append(collector)
+
+    def render(self) -> str:
+        """The function of writing all the metrics in the Prometheus text format.
+
+        :return: the text of the metrics
+        :rtype: str
+        """
+
+        with self.lock:
+            collectors = list(self.collectors)
+            metrics = list(self.metrics.values())
+
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f'{datetime.now()} - bot.metrics.Registry.render - {e}')
+
+        return ''.join(metric.render() for metric in metrics)
+
+
+registry = Registry()  # the metrics of the bot
+
+# the updater loop
+update_cycle_seconds = registry.histogram('eventer_update_cycle_seconds', 'Duration of the updater cycle.')
+update_stage_seconds = registry.histogram(
+    'eventer_update_stage_seconds', 'Duration of the stage of the event poll by the event: fetch, parse, diff, commit, notify.'
+)
+event_polls = registry.counter('eventer_event_polls_total', 'Event polls of the updater by the event and the result: unchanged, changed, error.')
+rows_parsed = registry.counter('eventer_rows_parsed_total', 'People rows parsed from the spreadsheet of the event.')
+events_changed = registry.counter('eventer_events_changed_total', 'Events written to the db by the event and the kind: insert, update, delete.')
+poll_interval_seconds = registry.gauge('eventer_poll_interval_seconds', 'Time until the next poll of the spreadsheet by the event.')
+poll_decisions = registry.counter(
+    'eventer_poll_decisions_total', 'Poll intervals chosen by the event and the reason: change, idle, activity, quota, error.'
+)
+cycle_db_queries = registry.gauge('eventer_update_cycle_db_queries', 'Db queries of the last updater cycle.')
+
+# the db
+db_queries = registry.counter('eventer_db_queries_total', 'Db queries executed.')
+db_pool = registry.gauge('eventer_db_pool', 'Connection pool counters by the name.')
+
+# the handlers' caches
+schedule_cache = registry.gauge('eventer_schedule_cache', 'Schedule cache counters by the name: size, hits, misses.')
+
+# the messages
+messages = registry.counter('eventer_messages_total', 'Messages by the result: queued, sent, retried, failed.')
+messages_pending = registry.gauge('eventer_messages_pending', 'Messages waiting to be sent.')
+
+# the handlers
+updates_pending = registry.gauge('eventer_updates_pending', 'Updates queued or being handled by the chat pool.')
+handler_seconds = registry.histogram('eventer_handler_seconds', 'Duration of the bot handler by the handler name.')
+
+
+def server(host='127.0.0.1', port=9108) -> ThreadingHTTPServer:
+    """The function of creating the local HTTP server of the metrics.
+
+    :param host: the address to listen on
+    :type host: str
+
+    :param port: the port to listen on
+    :type port: int
+
+    :return: the server, call serve_forever to start it
+    :rtype: ThreadingHTTPServer
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        """The handler of the requests to the metrics."""
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            body = registry.render().encode()
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', f'{len(body)}')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # every scrape would be printed otherwise
+
+    return ThreadingHTTPServer((host, port), MetricsHandler)
@@ -0,0 +1,241 @@
+from bisect import bisect_left, insort
+from heapq import nlargest, nsmallest
+from math import ceil, inf
+from collections import Counter
+from threading import Lock
+import logging
+
+# Connect logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def normalize(text: str) -> str:
+    """The function of bringing the name to the form for comparison: case folded, 'ё' as 'е', single spaces.
+
+    :param text: the name
+    :type text: str
+
+    :return: the normalized name
+    :rtype: str
+    """
+
+    return ' '.join(f'{text}'.casefold().replace('ё', 'е').split())
+
+
+def trigrams(text: str) -> set:
+    """The function of getting the trigrams of the normalized text, the words are padded with spaces.
+
+    :param text: the normalized text
+    :type text: str
+
+    :return: the trigrams
+    :rtype: set[str, ...]
+    """
+
+    text = f'  {text} '
+
+    return {text[i: i + 3] for i in range(len(text) - 2)}
+
+
+class NameIndex:
+    """The object finds the people by the inexact name or surname.
+    The people are ranked by the exact match, then by the prefix match, then by the trigram similarity.
+
+    people - the names by the person's db id as (first_name, last_name)
+    keys - the sorted list of (normalized name, person's db id), every person has 'surname name', 'name surname' and 'surname'
+    grams - the people's db ids by the trigram
+    threshold - the minimum part of the query trigrams found in the name
+
+    """
+
+    def __init__(self, threshold=0.4):
+        self.people = {}
+        self.keys = []
+        self.grams = {}
+        self.threshold = threshold
+        self.lock = Lock()
+
+    def __repr__(self):
+        return f'<NameIndex(people="{len(self.people)}", grams="{len(self.grams)}")>'
+
+    def load(self, people: dict) -> None:
+        """The function of adding the people from the dictionary of the people_from_db function.
+
+        :param people: dictionary of the people by the db id
+        :type people: dict
+
+        :return: nothing
+        :rtype: None
+        """
+
+        for person_id, person in people.items():
+            self.add(person_id, person['first_name'], person['last_name'])
+
+    def add(self, person_id: int, first_name: str, last_name: str) -> None:
+        """The function of adding the person or changing the person's name.
+
+        :param person_id: the person's db id
+        :type person_id: int
+
+        :param first_name: the person's name
+        :type first_name: str
+
+        :param last_name: the person's surname
+        :type last_name: str
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.lock:
+            self.discard(person_id)
+            self.people[person_id] = (first_name, last_name)
+
+            for key in self.person_keys(first_name, last_name):
+                insort(self.keys, (key, person_id))
+
+                for gram in trigrams(key):
+                    self.grams.setdefault(gram, set()).add(person_id)
+
+    def items(self) -> dict:
+        """The function of getting all the people in the form of the load function.
+
+        :return: dictionary of the people by the db id, every value has the 'first_name' and 'last_name' keys
+        :rtype: dict
+        """
+
+        with self.lock:
+            return {
+                person_id: {'first_name': first_name, 'last_name': last_name}
+                for person_id, (first_name, last_name) in self.people.items()
+            }
+
+    def remove(self, person_id: int) -> None:
+        """The function of removing the person.
+
+        :param person_id: the person's db id
+        :type person_id: int
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.lock:
+            self.discard(person_id)
+
+    def discard(self, person_id: int) -> None:
+        """The function of removing the person's keys, the lock must be held by the caller.
+
+        :param person_id: the person's db id
+        :type person_id: int
+
+        :return: nothing
+        :rtype: None
+        """
+
+        if person_id not in self.people:
+            return
+
+        for key in self.person_keys(*self.people.pop(person_id)):
+            i = bisect_left(self.keys, (key, person_id))
+            if i < len(self.keys) and self.keys[i] == (key, person_id):
+                del self.keys[i]
+
+            for gram in trigrams(key):
+                ids = self.grams.get(gram)
+                if ids is not None:
+                    ids.discard(person_id)
+                    if not ids:
+                        del self.grams[gram]
+
+    @staticmethod
+    def person_keys(first_name: str, last_name: str) -> set:
+        """The function of getting the normalized keys of the person.
+
+        :param first_name: the person's name
+        :type first_name: str
+
+        :param last_name: the person's surname
+        :type last_name: str
+
+        :return: the keys
+        :rtype: set[str, ...]
+        """
+
+        first_name, last_name = normalize(first_name), normalize(last_name)
+
+        return {f'{last_name} {first_name}', f'{first_name} {last_name}', last_name}
+
+    def search(self, query: str, limit=5) -> list:
+        """The function of finding the people by the name.
+        The similar names are looked for only if the prefix matches are fewer than the limit.
+        A similar name has at least the needed number of the query trigrams, so it has one of the rarest ones:
+        the candidates are taken from the people of the rarest trigrams only and the common ones are just checked.
+        The needed number is raised to the one of the best people found so far, so the common trigrams
+        of the repeated names are rarely used for the candidates.
+
+        :param query: the name, the surname or both in any order
+        :type query: str
+
+        :param limit: the maximum number of the found people
+        :type limit: int
+
+        :return: the found people as (score, person's db id, first_name, last_name), the best ones first;
+            the score is 2 for the exact match, 1 for the prefix match and the similarity from 0 to 1 otherwise
+        :rtype: list[tuple[float, int, str, str], ...]
+        """
+
+        query = normalize(query)
+        if not query:
+            return []
+
+        with self.lock:
+            # exact and prefix matches, the keys of the same name are next to each other
+            first = bisect_left(self.keys, (query,))
+            exact = bisect_left(self.keys, (query, inf), first)
+            last = bisect_left(self.keys, (query + chr(0x10ffff),), exact)
+
+            scores = {person_id: 1.0 for key, person_id in self.keys[exact:last]}
+            scores.update((person_id, 2.0) for key, person_id in self.keys[first:exact])
+
+            # similar names
+            if len(scores) < limit:
+                query_grams = trigrams(query)
+                postings = sorted((self.grams[gram] for gram in query_grams if gram in self.grams), key=len)
+                needed = max(1, ceil(self.threshold * len(query_grams)))
+                found, seen, wanted = Counter(), set(scores), limit - len(scores)
+
+                # the person with the needed trigrams has one of the rarest ones,
+                # the people found so far tell how many trigrams the best ones have at least
+                i = 0
+                while i < len(postings) - needed + 1:
+                    candidates = postings[i] - seen
+                    seen |= candidates
+                    for posting in postings:
+                        found.update(candidates.intersection(posting))
+
+                    best = nlargest(wanted, found.values())
+                    if len(best) == wanted:
+                        needed = max(needed, best[-1])
+                    i += 1
+
+                scores.update(
+                    (person_id, number / len(query_grams)) for person_id, number in found.items() if number >= needed
+                )
+
+            # only the people scored as high as the last found one are ordered by the name
+            cut = min(nlargest(limit, scores.values()), default=0.0)
+            ranked = nsmallest(
+                limit,
+                [(score, person_id) for person_id, score in scores.items() if score >= cut],
+                key=lambda item: (-item[0], self.people[item[1]][1], self.people[item[1]][0], item[1])
+            )
+
+            return [(score, person_id, *self.people[person_id]) for score, person_id in ranked]
+
+
+index = NameIndex()  # the people of the schedule
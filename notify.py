@@ -0,0 +1,306 @@
+from telebot import TeleBot
+from telebot.apihelper import ApiTelegramException
+from collections import deque
+from heapq import heappush, heappop
+from itertools import count
+from threading import Condition, Lock, Thread
+from datetime import datetime
+import time
+import metrics
+import logging
+
+# Connect logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """The object limits the rate of the messages of the whole bot.
+
+    rate - number of tokens added per second
+    capacity - maximum number of the saved tokens
+    tokens - number of the tokens available now
+    updated - time of the last update of the tokens
+
+    """
+
+    def __init__(self,
+                 rate=30.0,
+                 capacity=30.0
+                 ):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = Lock()
+
+    def __repr__(self):
+        return f'<TokenBucket(rate="{self.rate}", capacity="{self.capacity}", tokens="{self.tokens}")>'
+
+    def acquire(self) -> None:
+        """The function of waiting for a token and taking it.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                delay = (1 - self.tokens) / self.rate
+
+            time.sleep(delay)
+
+    def hold(self, seconds: float) -> None:
+        """The function of stopping giving the tokens for a while.
+
+        :param seconds: how long there will be no tokens
+        :type seconds: float
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.lock:
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class Dispatcher:
+    """The object sends the queued messages in the background.
+    The messages of one chat are sent one by one in the order they were queued,
+    different chats are sent in parallel within the global and per chat limits of Telegram.
+
+    bot - the bot object
+    workers - number of the threads sending messages
+    bucket - the TokenBucket object of the global limit
+    chat_interval - minimum interval between two messages to one chat in seconds
+    retries - number of the attempts to send one message
+    stats - counters of the queued, sent, retried and failed messages
+
+    """
+
+    def __init__(self,
+                 bot: TeleBot,
+                 workers=4,
+                 rate=30.0,
+                 chat_interval=1.0,
+                 retries=5
+                 ):
+        self.bot = bot
+        self.workers = workers
+        self.bucket = TokenBucket(rate=rate, capacity=rate)
+        self.chat_interval = chat_interval
+        self.retries = retries
+        self.stats = {
+            'queued': 0,
+            'sent': 0,
+            'retried': 0,
+            'failed': 0
+        }
+        self.chats = {}  # queued messages by chat id, the chat is here while it's in the ready heap or being sent
+        self.attempts = {}  # failed attempts of the first message by chat id
+        self.ready = []  # heap of the chats as (time to send, number, chat id)
+        self.numbers = count()
+        self.condition = Condition()
+        self.threads = []
+        self.running = False
+
+    def __repr__(self):
+        return f'<Dispatcher(workers="{self.workers}", chats="{len(self.chats)}", stats="{self.stats}")>'
+
+    def put(self, chat_id: int, text: str) -> None:
+        """The function of queueing the message.
+
+        :param chat_id: the user's tg chat id
+        :type chat_id: int
+
+        :param text: text of the message
+        :type text: str
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.condition:
+            self.stats['queued'] += 1
+            metrics.messages.inc(result='queued')
+
+            if chat_id in self.chats:  # the chat is already waiting for its turn
+                self.chats[chat_id].append(text)
+                return
+
+            self.chats[chat_id] = deque([text])
+            heappush(self.ready, (time.monotonic(), next(self.numbers), chat_id))
+            self.condition.notify()
+
+    def pending(self) -> int:
+        """The function of getting the number of the messages that aren't sent yet.
+
+        :return: number of the messages
+        :rtype: int
+        """
+
+        with self.condition:
+            return sum(len(messages) for messages in self.chats.values())
+
+    def start(self) -> None:
+        """The function of launching the worker threads.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        self.running = True
+
+        for _ in range(self.workers):
+            thread = Thread(target=self.worker, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self) -> None:
+        """The function of stopping the worker threads, the messages left in the queue aren't sent.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+        for thread in self.threads:
+            thread.join()
+
+        self.threads = []
+
+    def worker(self) -> None:
+        """The function of the worker thread.
+        Takes the chat whose turn has come, sends its first message and returns the chat to the heap.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        while True:
+            with self.condition:
+                while self.running and (not self.ready or self.ready[0][0] > time.monotonic()):
+                    self.condition.wait(self.ready[0][0] - time.monotonic() if self.ready else None)
+
+                if not self.running:
+                    return
+
+                _, _, chat_id = heappop(self.ready)
+                text = self.chats[chat_id][0]
+
+            sent, delay = self.send(chat_id, text)
+
+            with self.condition:
+                messages = self.chats[chat_id]
+
+                if sent is not None:  # the message is sent or dropped
+                    messages.popleft()
+                    self.attempts.pop(chat_id, None)
+
+                if messages:
+                    heappush(self.ready, (time.monotonic() + max(delay, self.chat_interval), next(self.numbers), chat_id))
+                    self.condition.notify()
+
+                else:
+                    del self.chats[chat_id]
+
+    def send(self, chat_id: int, text: str) -> tuple:
+        """The function of sending one message.
+        Too many requests and server errors are retried with the exponential backoff or after the time from Telegram.
+
+        :param chat_id: the user's tg chat id
+        :type chat_id: int
+
+        :param text: text of the message
+        :type text: str
+
+        :return: True if sent, False if dropped, None to retry and the delay before the next message of the chat
+        :rtype: tuple[bool | None, float]
+        """
+
+        self.bucket.acquire()
+
+        try:
+            self.bot.send_message(chat_id=chat_id, text=text)
+
+            with self.condition:
+                self.stats['sent'] += 1
+                metrics.messages.inc(result='sent')
+
+            return True, 0.0
+
+        except ApiTelegramException as e:
+            if e.error_code != 429 and e.error_code < 500:  # the message can't be sent, e.g. the bot is blocked
+                return self.drop(chat_id, e)
+
+            retry_after = (e.result_json.get('parameters') or {}).get('retry_after')
+            if retry_after:
+                self.bucket.hold(retry_after)
+
+            return self.retry(chat_id, e, retry_after)
+
+        except Exception as e:  # network errors
+            return self.retry(chat_id, e)
+
+    def retry(self, chat_id: int, error: Exception, retry_after=None) -> tuple:
+        """The function of counting the failed attempt.
+
+        :param chat_id: the user's tg chat id
+        :type chat_id: int
+
+        :param error: the error of the attempt
+        :type error: Exception
+
+        :param retry_after: seconds to wait from Telegram
+        :type retry_after: int | None
+
+        :return: None or False if there are no attempts left and the delay before the next attempt
+        :rtype: tuple[bool | None, float]
+        """
+
+        with self.condition:
+            attempts = self.attempts[chat_id] = self.attempts.get(chat_id, 0) + 1
+
+        if attempts >= self.retries:
+            return self.drop(chat_id, error)
+
+        with self.condition:
+            self.stats['retried'] += 1
+            metrics.messages.inc(result='retried')
+
+        return None, float(retry_after or min(2 ** attempts, 60))
+
+    def drop(self, chat_id: int, error: Exception) -> tuple:
+        """The function of giving up on the message.
+
+        :param chat_id: the user's tg chat id
+        :type chat_id: int
+
+        :param error: the last error of the message
+        :type error: Exception
+
+        :return: False and no delay
+        :rtype: tuple[bool, float]
+        """
+
+        with self.condition:
+            self.stats['failed'] += 1
+            metrics.messages.inc(result='failed')
+
+        print(f'{datetime.now()} - bot.notify.Dispatcher.send - {chat_id} - {error}')
+
+        return False, 0.0
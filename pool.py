@@ -0,0 +1,209 @@
+from telebot import TeleBot, types
+from collections import deque
+from functools import wraps
+from threading import Condition, Thread
+from datetime import datetime
+import time
+import metrics
+import logging
+
+# Connect logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def timed(function):
+    """The decorator of the handler writing its durations to the metrics.
+
+    :param function: the handler
+    :type function: Callable
+
+    :return: the handler with the counting
+    :rtype: Callable
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+
+        try:
+            return function(*args, **kwargs)
+
+        finally:
+            metrics.handler_seconds.observe(time.perf_counter() - start, handler=function.__name__)
+
+    return wrapper
+
+
+class ChatPool:
+    """The object runs the tasks on the worker threads.
+    The tasks of one chat run one by one in the order they were submitted, different chats run in parallel.
+
+    workers - number of the worker threads
+    chats - queued tasks by the chat id, the chat is here while its tasks are queued or running
+    ready - the chats waiting for a worker
+
+    """
+
+    def __init__(self, workers=8):
+        self.workers = workers
+        self.chats = {}
+        self.ready = deque()
+        self.condition = Condition()
+        self.threads = []
+        self.running = False
+
+    def __repr__(self):
+        return f'<ChatPool(workers="{self.workers}", chats="{len(self.chats)}", depth="{self.depth()}")>'
+
+    def submit(self, chat_id, task, *args, **kwargs) -> None:
+        """The function of queueing the task of the chat.
+
+        :param chat_id: the chat id or any other key of the order
+        :type chat_id: Hashable
+
+        :param task: the function to run
+        :type task: Callable
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.condition:
+            if chat_id in self.chats:  # the chat is already waiting or running
+                self.chats[chat_id].append((task, args, kwargs))
+                return
+
+            self.chats[chat_id] = deque([(task, args, kwargs)])
+            self.ready.append(chat_id)
+            self.condition.notify()
+
+    def depth(self) -> int:
+        """The function of getting the number of the tasks that aren't finished yet.
+
+        :return: number of the tasks
+        :rtype: int
+        """
+
+        with self.condition:
+            return sum(len(tasks) for tasks in self.chats.values())
+
+    def start(self) -> None:
+        """The function of launching the worker threads.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        self.running = True
+
+        for _ in range(self.workers):
+            thread = Thread(target=self.worker, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self) -> None:
+        """The function of stopping the worker threads after their current tasks.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+        for thread in self.threads:
+            thread.join()
+
+        self.threads = []
+
+    def worker(self) -> None:
+        """The function of the worker thread.
+        Takes the next chat, runs its first task and returns the chat to the end of the queue.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        while True:
+            with self.condition:
+                while self.running and not self.ready:
+                    self.condition.wait()
+
+                if not self.running:
+                    return
+
+                chat_id = self.ready.popleft()
+                task, args, kwargs = self.chats[chat_id][0]
+
+            try:
+                task(*args, **kwargs)
+            except Exception as e:
+                print(f'{datetime.now()} - bot.pool.ChatPool.worker - {e}')
+
+            with self.condition:
+                tasks = self.chats[chat_id]
+                tasks.popleft()
+
+                if tasks:
+                    self.ready.append(chat_id)
+                    self.condition.notify()
+
+                else:
+                    del self.chats[chat_id]
+
+
+def update_chat(update: types.Update):
+    """The function of getting the chat of the update.
+
+    :param update: the received update from telegram
+    :type update: types.Update
+
+    :return: the chat id or the user id, the update id if the update has neither
+    :rtype: int | str
+    """
+
+    for message in (update.message, update.edited_message, update.channel_post, update.edited_channel_post):
+        if message:
+            return message.chat.id
+
+    for query in (update.callback_query, update.inline_query, update.chosen_inline_result):
+        if query:
+            return query.from_user.id
+
+    return f'update:{update.update_id}'
+
+
+class PooledTeleBot(TeleBot):
+    """The bot handling the updates of different chats in parallel on the ChatPool.
+    The updates of one chat are handled in order, so the next step handlers stay ordered.
+
+    pool - the ChatPool object, its depth is written to the metrics
+
+    """
+
+    def __init__(self, token: str, workers=8, **kwargs):
+        super().__init__(token, threaded=False, **kwargs)
+        self.pool = ChatPool(workers=workers)
+        self.pool.start()
+
+        metrics.registry.collect(lambda: metrics.updates_pending.set(self.pool.depth()))
+
+    def process_new_updates(self, updates: list) -> None:
+        """The function of queueing the updates to the chats of the pool.
+
+        :param updates: the received updates from telegram
+        :type updates: list[types.Update, ...]
+
+        :return: nothing
+        :rtype: None
+        """
+
+        for update in updates:
+            # the polling takes the next updates from this id, so it's moved before the update is handled
+            self.last_update_id = max(self.last_update_id, update.update_id)
+            self.pool.submit(update_chat(update), TeleBot.process_new_updates, self, [update])
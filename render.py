@@ -0,0 +1,125 @@
+import logging
+
+# Connect logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+MESSAGE_LENGTH = 4096  # the maximum length of the tg message text
+
+
+def schedule_rows(events: list) -> list:
+    """The function of creating rows of the schedule, consecutive events with the same action are merged.
+    Example of the row:
+        '09:00 - 10:30 - Action'
+
+    :param events: the ordered list of the person's Event objects
+    :type events: list[Event, ...]
+
+    :return: rows of the schedule
+    :rtype: list[str, ...]
+    """
+
+    rows = []
+
+    if not events:
+        return rows
+
+    current_action = events[0].action
+    current_start = events[0].start
+    current_end = events[0].end
+
+    for event in events[1:]:
+        if current_action == event.action:
+            current_end = event.end
+
+        else:
+            rows.append(f'{current_start.strftime("%H:%M")} - {current_end.strftime("%H:%M")} - {current_action}')
+            current_action = event.action
+            current_start = event.start
+            current_end = event.end
+
+    rows.append(f'{current_start.strftime("%H:%M")} - ... - {current_action}')
+
+    return rows
+
+
+def schedule_messages(events: list, length=MESSAGE_LENGTH) -> list:
+    """The function of creating the texts of the messages with the schedule, every text fits one tg message.
+
+    :param events: the ordered list of the person's Event objects
+    :type events: list[Event, ...]
+
+    :param length: the maximum length of one text
+    :type length: int
+
+    :return: texts of the messages
+    :rtype: list[str, ...]
+    """
+
+    return rows_messages(schedule_rows(events), length)
+
+
+def grouped_messages(groups: list, length=MESSAGE_LENGTH) -> list:
+    """The function of creating the texts of the messages with the schedules of several events,
+    the rows of every event follow its title.
+
+    :param groups: the events as (title, the ordered list of the person's Event objects)
+    :type groups: list[tuple[str, list[Event, ...]], ...]
+
+    :param length: the maximum length of one text
+    :type length: int
+
+    :return: texts of the messages
+    :rtype: list[str, ...]
+    """
+
+    rows = []
+
+    for title, events in groups:
+        if events:
+            rows.append(f'{title}:')
+            rows.extend(schedule_rows(events))
+
+    return rows_messages(rows, length)
+
+
+def rows_messages(rows: list, length=MESSAGE_LENGTH) -> list:
+    """The function of joining the rows of the schedule into the texts of the messages.
+
+    :param rows: rows of the schedule
+    :type rows: list[str, ...]
+
+    :param length: the maximum length of one text
+    :type length: int
+
+    :return: texts of the messages
+    :rtype: list[str, ...]
+    """
+
+    if not rows:
+        return ['Ивентов не найдено.']
+
+    messages = []
+    message = ''
+
+    for row in rows:
+        while len(row) > length:  # the row doesn't fit even an empty message
+            if message:
+                messages.append(message)
+                message = ''
+            messages.append(row[:length])
+            row = row[length:]
+
+        if message and len(message) + 1 + len(row) > length:
+            messages.append(message)
+            message = ''
+
+        message = f'{message}\n{row}' if message else row
+
+    if message:
+        messages.append(message)
+
+    return messages
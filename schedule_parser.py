@@ -1,13 +1,21 @@
 from __future__ import print_function
 import os.path
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 import logging
-from configParser import ggl_token_file_name, credentials_file_name, spreadsheet_id, ranges
+import configParser
+from configParser import ggl_token_file_name, credentials_file_name
 import os
+import json
+import hashlib
+from sys import intern
 from datetime import datetime, timezone, timedelta
+from threading import RLock, local
+from abc import ABC, abstractmethod
+from itertools import islice
 
 # Connect logging
 logging.basicConfig(
@@ -16,6 +24,150 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+fetch_mode = getattr(configParser, 'fetch_mode', 'values')  # 'values' - values only, 'grid' - grid data
+start_date = getattr(configParser, 'start_date', '2021-10-02')  # used if there is no date in the table header
+spreadsheet_id = getattr(configParser, 'spreadsheet_id', '')  # the spreadsheet of the single event
+ranges = getattr(configParser, 'ranges', '')
+SCOPES = ['https://www.googleapis.com/auth/drive.metadata.readonly', 'https://www.googleapis.com/auth/drive']
+
+
+class GoogleClient:
+    """The object keeps the Google credentials and the built services between the polls.
+
+    token_file_name - name of the file with the token
+    refresh_margin - how long before the expiry the credentials are refreshed
+    creds - credentials
+    token - the token as it is in the token file
+    generation - number of the credentials changes, the services built with the old credentials are dropped
+    local - the thread's built services by name and version, the http client of a service isn't thread-safe
+
+    """
+
+    def __init__(self,
+                 token_file_name=ggl_token_file_name,
+                 refresh_margin=timedelta(minutes=5)
+                 ):
+        self.token_file_name = token_file_name
+        self.refresh_margin = refresh_margin
+        self.creds = None
+        self.token = None
+        self.generation = 0
+        self.local = local()
+        self.lock = RLock()
+
+    def __repr__(self):
+        return f'<GoogleClient(token_file_name="{self.token_file_name}", generation="{self.generation}")>'
+
+    def credentials(self) -> Credentials:
+        """The function of getting the credentials, refreshed if they are about to expire.
+
+        :return: credentials
+        :rtype: Credentials
+        """
+
+        with self.lock:
+            # try to read the credentials from the token file
+            if not self.creds and os.path.exists(self.token_file_name):
+                self.creds = Credentials.from_authorized_user_file(self.token_file_name, SCOPES)
+                self.token = self.creds.to_json()
+
+            creds = self.creds
+            expires_soon = creds and creds.expiry and creds.expiry - datetime.utcnow() < self.refresh_margin
+
+            # create or update credentials and token file
+            if not creds or not creds.valid or expires_soon:
+                if creds and creds.refresh_token:
+                    creds.refresh(Request())
+
+                else:
+                    flow = InstalledAppFlow.from_client_secrets_file(credentials_file_name, SCOPES)
+                    self.creds = flow.run_local_server(port=0)
+                    self.generation += 1  # the services are bound to the old credentials
+
+                self.save()
+
+            return self.creds
+
+    def save(self) -> None:
+        """The function of writing the token file if the token has changed.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        token = self.creds.to_json()
+
+        if token != self.token:
+            with open(self.token_file_name, 'w') as token_file:
+                token_file.write(token)
+            self.token = token
+
+    def service(self, name: str, version: str):
+        """The function of getting the thread's built service, the discovery document is loaded once per thread.
+
+        :param name: name of the service as 'sheets'
+        :type name: str
+
+        :param version: version of the service as 'v4'
+        :type version: str
+
+        :return: the service object
+        :rtype: Resource
+        """
+
+        with self.lock:
+            credentials = self.credentials()
+            generation = self.generation
+
+        if getattr(self.local, 'generation', None) != generation:
+            self.local.services = {}
+            self.local.generation = generation
+
+        services = self.local.services
+        if (name, version) not in services:
+            services[(name, version)] = build(name, version, credentials=credentials, cache_discovery=False)
+
+        return services[(name, version)]
+
+
+client = GoogleClient()  # the client shared by all polls
+
+
+class QuotaExceeded(Exception):
+    """The Google API has refused the request because of the quota.
+
+    retry_after - seconds to wait from the Retry-After header or None
+
+    """
+
+    def __init__(self, message='', retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FetchError(Exception):
+    """The spreadsheet can't be fetched, the poll is the error and not the unchanged sheet."""
+
+
+def check_quota(error: Exception) -> None:
+    """The function of raising the QuotaExceeded instead of the HttpError about the exceeded quota.
+    Sheets answers 429, Drive answers 429 or 403 with the rateLimitExceeded reason.
+
+    :param error: the error of the request
+    :type error: Exception
+
+    :return: nothing
+    :rtype: None
+    """
+
+    if not isinstance(error, HttpError):
+        return
+
+    status = error.resp.status
+    if status == 429 or status == 403 and b'ateLimitExceeded' in (error.content or b''):
+        retry_after = error.resp.get('retry-after')
+        raise QuotaExceeded(f'{error}', float(retry_after) if retry_after and retry_after.isdigit() else None) from error
+
 
 def get_creds() -> Credentials:
     """The function of creating credentials in order to connect to Google Drive files.
@@ -24,26 +176,52 @@ def get_creds() -> Credentials:
     :rtype: Credentials
     """
 
-    SCOPES = ['https://www.googleapis.com/auth/drive.metadata.readonly', 'https://www.googleapis.com/auth/drive']
+    return client.credentials()
+
+
+class EventSheet:
+    """The event of the bot with its own schedule spreadsheet.
+
+    id - the event id, the schedule rows of the event are kept under it
+    title - the event title for the messages
+    spreadsheet_id - spreadsheet id
+    ranges - range of columns as 'A:Z'
+    start_date - the date of the first slot if there is no date in the table header
+
+    """
+
+    def __init__(self,
+                 id='default',
+                 title='',
+                 spreadsheet_id=spreadsheet_id,
+                 ranges=ranges,
+                 start_date=start_date
+                 ):
+        self.id = id
+        self.title = title or id
+        self.spreadsheet_id = spreadsheet_id
+        self.ranges = ranges
+        self.start_date = start_date
+
+    def __repr__(self):
+        return f'<EventSheet(id="{self.id}", spreadsheet_id="{self.spreadsheet_id}", ranges="{self.ranges}")>'
 
-    # try to read the credentials from the token file
-    creds = None
-    if os.path.exists(ggl_token_file_name):
-        creds = Credentials.from_authorized_user_file(ggl_token_file_name, SCOPES)
 
-    # create or update credentials and token file
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+def event_sheets() -> list:
+    """The function of getting the events of the bot from the events list of the config.
+    Every event is a dictionary with the EventSheet fields,
+    the config without the list has the single event 'default' of the spreadsheet_id and ranges.
 
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(credentials_file_name, SCOPES)
-            creds = flow.run_local_server(port=0)
+    :return: list of the EventSheet objects
+    :rtype: list[EventSheet, ...]
+    """
 
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
+    events = getattr(configParser, 'events', None)
 
-    return creds
+    if not events:
+        return [EventSheet()]
+
+    return [EventSheet(**event) for event in events]
 
 
 def get_row_data(spreadsheet_id: str, ranges: str) -> list:
@@ -59,29 +237,28 @@ def get_row_data(spreadsheet_id: str, ranges: str) -> list:
     :rtype: list[...]
     """
 
-    rowData = []
-
-    credentials = get_creds()
-
     try:
-        service = build('sheets', 'v4', credentials=credentials)
+        service = client.service('sheets', 'v4')
 
         request = service.spreadsheets().get(
             spreadsheetId=spreadsheet_id,
             ranges=ranges,
-            includeGridData=True
+            includeGridData=True,
+            fields='sheets/data/rowData/values/formattedValue'
         )
         response = request.execute()
         rowData = response['sheets'][0]['data'][0]['rowData']
 
     except Exception as e:
-        print(f'{datetime.now(timezone(timedelta(hours=3.0)))} - parsers.schedule_parser.get_row_data - {e}')
+        check_quota(e)
+        raise FetchError(f'parsers.schedule_parser.get_row_data - {e}') from e
 
     return rowData
 
 
-def get_table(spreadsheet_id: str, ranges: str) -> list:
-    """The function of getting data from a spreadsheet in a readable, unformatted form.
+def get_rows(spreadsheet_id: str, ranges: str) -> list:
+    """The function of getting the rows of the spreadsheet as they are sent, without turning them into columns.
+    In the grid mode the formatted values are taken from the grid data rows.
 
     :param spreadsheet_id: spreadsheet id
     :type spreadsheet_id: str
@@ -89,54 +266,201 @@ def get_table(spreadsheet_id: str, ranges: str) -> list:
     :param ranges: range of columns as 'A:Z'
     :type ranges: str
 
-    :return: list of columns with formatted values or None
-    :rtype: list[[str | None, ...], ...]
+    :return: list of rows with formatted values, the empty cells at the end of the row are missing
+    :rtype: list[[str, ...], ...]
     """
 
-    table = []
+    if fetch_mode != 'values':
+        return [
+            [value.get('formattedValue', '') if value else '' for value in row.get('values', [])]
+            for row in get_row_data(spreadsheet_id=spreadsheet_id, ranges=ranges)
+        ]
 
-    row_data = get_row_data(
-        spreadsheet_id=spreadsheet_id,
-        ranges=ranges
-    )
+    try:
+        service = client.service('sheets', 'v4')
 
-    for row in row_data:
-        try:
-            # filling the table
-            for i, value in enumerate(row['values']):
-                if len(table) <= i:
-                    table.append([])
+        request = service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=ranges,
+            majorDimension='ROWS',
+            valueRenderOption='FORMATTED_VALUE'
+        )
+        response = request.execute()
+        rows = response.get('values', [])
 
-                if value and 'formattedValue' in value.keys():
-                    formatted_value = value['formattedValue']
-                else:
-                    if i == 0:
-                        continue
+    except Exception as e:
+        check_quota(e)
+        raise FetchError(f'parsers.schedule_parser.get_rows - {e}') from e
+
+    return rows
+
+
+class SheetSource(ABC):
+    """The source of the schedule table, the sources implement the rows and may tell the revision.
+
+    revision - cheap marker of the spreadsheet state, None if the source can't tell
+    rows - the list of rows as the get_rows function returns
+
+    """
+
+    def revision(self) -> str or None:
+        return None
+
+    @abstractmethod
+    def rows(self) -> list:
+        pass
+
+
+class GoogleSheetSource(SheetSource):
+    """The source of the schedule table from Google Sheets.
+
+    spreadsheet_id - spreadsheet id
+    ranges - range of columns as 'A:Z'
+
+    """
+
+    def __init__(self,
+                 spreadsheet_id=spreadsheet_id,
+                 ranges=ranges
+                 ):
+        self.spreadsheet_id = spreadsheet_id
+        self.ranges = ranges
 
-                    else:
-                        formatted_value = 'Отдых'
+    def __repr__(self):
+        return f'<GoogleSheetSource(spreadsheet_id="{self.spreadsheet_id}", ranges="{self.ranges}")>'
 
-                table[i].append(formatted_value)
+    def revision(self) -> str or None:
+        try:
+            service = client.service('drive', 'v3')
+            file = service.files().get(fileId=self.spreadsheet_id, fields='version,modifiedTime').execute()
+            return f'{file["version"]}:{file["modifiedTime"]}'
 
         except Exception as e:
-            print(f'{datetime.now(timezone(timedelta(hours=3.0)))} - parsers.schedule_parser.get_table - {e}')
+            check_quota(e)
+            print(f'{datetime.now(timezone(timedelta(hours=3.0)))} - parsers.schedule_parser.GoogleSheetSource.revision - {e}')
 
-    return table
+        return None
 
+    def rows(self) -> list:
+        return get_rows(self.spreadsheet_id, self.ranges)
 
-class Event:
-    """The event object.
+
+class LocalSheetSource(SheetSource):
+    """The source of the schedule table kept in memory, for offline runs.
+
+    table - the list of rows as the get_rows function returns
+    version - number of the table changes
+
+    """
+
+    def __init__(self, table=None):
+        self.table = table or []
+        self.version = 0
+
+    def __repr__(self):
+        return f'<LocalSheetSource(version="{self.version}", rows="{len(self.table)}")>'
+
+    def set_rows(self, rows: list) -> None:
+        self.table = rows
+        self.version += 1
+
+    def revision(self) -> str or None:
+        return str(self.version)
+
+    def rows(self) -> list:
+        return self.table
+
+
+class SheetWatcher:
+    """The object of detecting changes of the schedule table.
+    Fetches the rows only when the revision has changed and compares them with the last ones by the hash,
+    the rows themselves aren't kept, so the old and the new sheet aren't in memory together.
+
+    source - the SheetSource object
+    revision - revision of the last fetched rows
+    digest - content hash of the last fetched rows
+
+    """
+
+    def __init__(self, source: SheetSource):
+        self.source = source
+        self.revision = None
+        self.digest = None
+
+    def __repr__(self):
+        return f'<SheetWatcher(source={self.source}, revision="{self.revision}", digest="{self.digest}")>'
+
+    def poll(self) -> list or None:
+        """The function of getting the rows if they have changed since the last poll.
+
+        :return: list of rows with formatted values or None if nothing has changed
+        :rtype: list[[str, ...], ...] | None
+        """
+
+        revision = self.source.revision()
+        if revision is not None and revision == self.revision:
+            return None
+
+        rows = self.source.rows()  # the FetchError is raised if the rows can't be fetched
+        if not rows:  # the empty sheet, nothing to parse
+            return None
+
+        self.revision = revision
+
+        digest = hashlib.sha256()
+        for row in rows:  # row by row, the whole sheet isn't copied into one string
+            digest.update(json.dumps(row, ensure_ascii=False).encode())
+            digest.update(b'\n')
+        digest = digest.hexdigest()
+
+        if digest == self.digest:
+            return None
+
+        self.digest = digest
+
+        return rows
+
+
+class Person:
+    """The person of the events, one object is shared by all the person's events.
 
     name - person's name
     surname - the person's surname
     user_name - the person's telegram tag
     chat_id - the person's telegram chat id
+
+    """
+
+    __slots__ = ('name', 'surname', 'user_name', 'chat_id')
+
+    def __init__(self,
+                 name='name',
+                 surname='surname',
+                 user_name='user_name',
+                 chat_id=0
+                 ):
+        self.name = name
+        self.surname = surname
+        self.user_name = user_name
+        self.chat_id = chat_id
+
+    def __repr__(self):
+        return f'<Person(name="{self.name}", surname="{self.surname}", user_name="{self.user_name}", chat_id="{self.chat_id}")>'
+
+
+class Event:
+    """The event object.
+    The person's fields are read from the shared Person object and the actions are interned.
+
+    person - the Person object, made from the name, surname, user_name and chat_id if not passed
     action - place or action that the person should do
     start - start time of the event
     end - end time of the event
 
     """
 
+    __slots__ = ('person', 'action', 'start', 'end')
+
     def __init__(self,
                  name='name',
                  surname='surname',
@@ -144,16 +468,30 @@ class Event:
                  action='action',
                  chat_id=0,
                  start=datetime.strptime('0:00', '%H:%M'),
-                 end=datetime.strptime('0:00', '%H:%M')
+                 end=datetime.strptime('0:00', '%H:%M'),
+                 person=None
                  ):
-        self.name = name
-        self.surname = surname
-        self.user_name = user_name
-        self.chat_id = chat_id
-        self.action = action
+        self.person = person or Person(name=name, surname=surname, user_name=user_name, chat_id=chat_id)
+        self.action = intern(action) if type(action) is str else action
         self.start = start
         self.end = end
 
+    @property
+    def name(self):
+        return self.person.name
+
+    @property
+    def surname(self):
+        return self.person.surname
+
+    @property
+    def user_name(self):
+        return self.person.user_name
+
+    @property
+    def chat_id(self):
+        return self.person.chat_id
+
     def __repr__(self):
         return f'<Event(name="{self.name}", surname="{self.surname}", user_name="{self.user_name}", chat_id="{self.chat_id}", start={self.start}", end="{self.end}", action="{self.action}")>'
 
@@ -169,58 +507,261 @@ class Event:
         except Exception as e:
             print(f'{datetime.now(timezone(timedelta(hours=3.0)))} - parsers.schedule_parser.Event - {e}')
 
+    def __lt__(self, other):
+        return self.start < other.start
+
+
+class EventFeed:
+    """The events of the parsed people, the Event objects are made only while the feed is iterated.
+    The feed keeps the rows of the people instead of the events, so the sheet isn't copied.
+
+    columns - indexes of the slot columns in the row
+    axis - list of the start and end of every slot
+    people - list of (Person, row) of the people
+
+    """
+
+    def __init__(self, columns=None, axis=None):
+        self.columns = columns or []
+        self.axis = axis or []
+        self.people = []
+
+    def __repr__(self):
+        return f'<EventFeed(people="{len(self.people)}", slots="{len(self.axis)}")>'
+
+    def __len__(self):
+        return len(self.people) * len(self.axis)
+
+    def __iter__(self):
+        for person, row in self.people:
+            yield from self.person_events(person, row)
+
+    def add(self, person: Person, row: list) -> None:
+        self.people.append((person, row))
+
+    def person_events(self, person: Person, row: list):
+        """The generator of the person's events, the empty cells are 'Отдых'.
+
+        :param person: the Person object
+        :type person: Person
+
+        :param row: the person's row
+        :type row: list[str, ...]
+
+        :return: the Event objects in the order of the slots
+        :rtype: Iterator[Event]
+        """
+
+        width = len(row)
+
+        for i, (start, end) in zip(self.columns, self.axis):
+            yield Event(person=person, action=row[i] if i < width and row[i] else 'Отдых', start=start, end=end)
+
+    def by_person(self):
+        """The generator of the events grouped by the person.
+
+        :return: (tg username, the generator of the person's events) for every person
+        :rtype: Iterator[tuple[str, Iterator[Event]]]
+        """
+
+        for person, row in self.people:
+            yield person.user_name, self.person_events(person, row)
 
-def parser() -> list:
-    """The function of creating a list of events from the parsed table.
+    def first_events(self):
+        """The generator of the first event of every person, enough to know the people of the feed.
 
-    :return: list of the Event objects
-    :rtype: list[Event, ...]
+        :return: the Event objects
+        :rtype: Iterator[Event]
+        """
+
+        for person, row in self.people:
+            yield from islice(self.person_events(person, row), 1)
+
+
+class Changes:
+    """The object is the result of parsing the table against the previous fingerprints.
+
+    events - the EventFeed or the list of the Event objects of the added and changed people
+    changed - tg usernames of the added and changed people
+    removed - tg usernames of the people who are not in the table anymore
+    fingerprints - fingerprints of the people's rows by tg username
+
+    """
+
+    def __init__(self,
+                 events=None,
+                 changed=None,
+                 removed=None,
+                 fingerprints=None
+                 ):
+        self.events = events if events is not None else EventFeed()
+        self.changed = changed or set()
+        self.removed = removed or set()
+        self.fingerprints = fingerprints or {}
+
+    def __repr__(self):
+        return f'<Changes(events="{len(self.events)}", changed="{len(self.changed)}", removed="{len(self.removed)}")>'
+
+
+def fingerprint(*cells) -> str:
+    """The function of getting a short hash of the cells.
+
+    :param cells: values of the cells
+    :type cells: str
+
+    :return: hex digest of the cells
+    :rtype: str
+    """
+
+    return hashlib.blake2b('\x1f'.join(cells).encode(), digest_size=16).hexdigest()
+
+
+def parse_date(value: str) -> datetime or None:
+    """The function of parsing a date cell of the table header.
+
+    :param value: the value of the cell
+    :type value: str
+
+    :return: the date or None if the cell isn't a date
+    :rtype: datetime | None
     """
 
-    evnts = []
+    for date_format in ('%Y-%m-%d', '%d.%m.%Y', '%d.%m.%y'):
+        try:
+            return datetime.strptime(value.strip(), date_format)
+        except ValueError:
+            pass
+
+    return None
+
+
+def parse_time(value: str) -> timedelta or None:
+    """The function of parsing a time cell of the table header.
+
+    :param value: the value of the cell
+    :type value: str
+
+    :return: the time from the midnight or None if the cell isn't a time
+    :rtype: timedelta | None
+    """
 
     try:
-        table = get_table(spreadsheet_id, ranges)
+        time = datetime.strptime(value.strip(), '%H:%M')
+    except ValueError:
+        return None
 
-        names = table[0][1:]
-        tg_usernames = table[1][1:]
-        events = [table[i][1:] for i in range(6, 69)]
-        timings = [table[i][0] for i in range(6, 69)] + ['00:00']
+    return timedelta(hours=time.hour, minutes=time.minute)
 
-        for person, name in enumerate(names):
-            date = '2021-10-02'
-            name = name.split()
 
-            if len(name) == 1:
-                print(f'{datetime.now()} - parsers.schedule_parser.parser - name is {name} and it\'s wrong')
-                continue
+def header_axis(header: list, default_date=None) -> tuple:
+    """The function of getting the time slots of the header row, they are the same for every person.
+    The slots are the columns from the first one with the time in the header, a date in the header
+    sets the date of the following slots, otherwise the date changes when the time goes back.
+    The date of the first slot is the last date in the header before the slots or the start_date from the config.
+    The last slot is as long as the previous one.
 
-            surname, name = name[0], name[1]
-            tg_username = tg_usernames[person]
+    :param header: the first row of the table
+    :type header: list[str, ...]
 
-            # filling the evnts
-            for number, action in enumerate(events):
+    :param default_date: the date of the first slot as '2021-10-02' instead of the start_date from the config
+    :type default_date: str | None
 
-                if timings[number] == '0:00':
-                    date = datetime.strptime(date, '%Y-%m-%d')
-                    date += timedelta(days=1)
-                    date = date.strftime('%Y-%m-%d')
+    :return: indexes of the slot columns and list of the start and end of every slot
+    :rtype: tuple[list[int, ...], list[tuple[datetime, datetime], ...]]
+    """
 
-                time_start = datetime.strptime(date + ' ' + timings[number], '%Y-%m-%d %H:%M')
-                time_end = datetime.strptime(date + ' ' + timings[number + 1], '%Y-%m-%d %H:%M')
+    date = datetime.strptime(default_date or start_date, '%Y-%m-%d')
 
-                event = Event(
-                    name=name,
-                    surname=surname,
-                    user_name=tg_username,
-                    action=action[person],
-                    start=time_start,
-                    end=time_end
-                )
+    first = 2
+    while first < len(header) and parse_time(header[first]) is None:
+        first += 1
+        date = parse_date(header[first - 1]) or date
 
-                evnts.append(event)
+    columns, starts = [], []
 
-    except Exception as e:
-        print(f'{datetime.now(timezone(timedelta(hours=3.0)))} - parsers.schedule_parser.parser - {e}')
+    for i in range(first, len(header)):
+        time = parse_time(header[i])
+
+        if time is None:
+            new_date = parse_date(header[i])
+            if new_date is None:  # the end of the slots
+                break
+
+            date = new_date
+            continue
+
+        if starts and date + time <= starts[-1]:  # the next day
+            date += timedelta(days=1)
+
+        columns.append(i)
+        starts.append(date + time)
+
+    if not starts:
+        return columns, []
+
+    step = starts[-1] - starts[-2] if len(starts) > 1 else timedelta(hours=1)
+
+    return columns, list(zip(starts, starts[1:] + [starts[-1] + step]))
+
+
+def parse_rows(rows=None, fingerprints=None, default_date=None) -> Changes:
+    """The function of parsing the rows only for the people whose rows have changed since the previous parse.
+    The rows are read one by one, the events of the changed people are made later, while the EventFeed is iterated.
+    The fingerprint of a person covers the name, the tg username, the actions and the timings of the table.
+    The empty rows and the rows without the name are skipped, the other empty cells are 'Отдых'.
+    The errors are raised, so the caller doesn't take the sheet that wasn't parsed for the parsed one.
+
+    :param rows: list of rows as the get_rows function returns, fetched from the spreadsheet if not passed
+    :type rows: list[[str, ...], ...] | None
+
+    :param fingerprints: fingerprints of the previous parse, every person is changed if not passed
+    :type fingerprints: dict | None
+
+    :param default_date: the date of the first slot if there is no date in the table header
+    :type default_date: str | None
+
+    :return: the changes of the table with the EventFeed
+    :rtype: Changes
+    """
+
+    fingerprints = fingerprints or {}
+    changes = Changes()
+
+    if rows is None:
+        rows = get_rows(spreadsheet_id, ranges)
+
+    rows = (row for row in rows if any(row))
+    columns, axis = header_axis(next(rows, []), default_date)
+    if not axis:  # every person would be changed to the empty schedule
+        raise ValueError('there are no time slots in the header of the table')
+
+    changes.events = EventFeed(columns, axis)
+    axis_fingerprint = fingerprint(*(f'{start}' for start, end in axis))
+
+    for row in rows:
+        name = row[0].split()
+
+        if not name:  # not a person
+            continue
+
+        if len(name) == 1:
+            print(f'{datetime.now()} - parsers.schedule_parser.parser - name is {name} and it\'s wrong')
+            continue
+
+        surname, name = name[0], name[1]
+        tg_username = row[1] if len(row) > 1 and row[1] else 'Отдых'
+        width = len(row)
+
+        changes.fingerprints[tg_username] = fingerprint(
+            axis_fingerprint, name, surname, tg_username,
+            *(row[i] if i < width and row[i] else 'Отдых' for i in columns)
+        )
+        if fingerprints.get(tg_username) == changes.fingerprints[tg_username]:
+            continue
+
+        changes.changed.add(tg_username)
+        changes.events.add(Person(name=name, surname=surname, user_name=tg_username), row)
+
+    changes.removed = set(fingerprints) - set(changes.fingerprints)
 
-    return evnts
+    return changes
@@ -0,0 +1,89 @@
+"""The offline check of the change detection of the schedule table.
+
+Drives the SheetWatcher over the LocalSheetSource, with the stand-ins of the bench for the configs,
+through the unchanged revision, the changed revision with the same rows and the changed rows,
+and prints whether the rows were fetched and returned on every poll.
+
+    python sheet_check.py
+
+"""
+
+from bench import configure, generate, edit
+import sys
+import tempfile
+
+
+def main() -> None:
+    """The main function.
+    Runs the checks and exits with 1 if any poll isn't the expected one.
+
+    :return: nothing
+    :rtype: None
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(directory)
+
+        from schedule_parser import SheetSource, SheetWatcher, LocalSheetSource
+
+        class CountingSource(LocalSheetSource):
+            """The LocalSheetSource counting the fetches of the rows."""
+
+            fetches = 0
+
+            def rows(self) -> list:
+                self.fetches += 1
+                return super().rows()
+
+        class BlindSource(CountingSource):
+            """The source that can't tell the revision, the rows are compared by the hash only."""
+
+            def revision(self) -> str or None:
+                return None
+
+        rows = generate(5, 8)
+        source = CountingSource()
+        source.set_rows(rows)
+        watcher = SheetWatcher(source)
+        checks = []
+
+        def poll(name: str, expected: tuple) -> None:
+            fetches = source.fetches
+            result = watcher.poll()
+            checks.append((name, (result is not None, source.fetches > fetches), expected))
+
+        # (returned the rows, fetched the rows)
+        poll('first poll', (True, True))
+        poll('unchanged revision', (False, False))
+
+        source.set_rows([list(row) for row in rows])
+        poll('same rows, new revision', (False, True))
+        poll('unchanged revision', (False, False))
+
+        source.set_rows(edit(rows, 0.2))
+        poll('changed rows', (True, True))
+
+        source = BlindSource(rows)
+        watcher = SheetWatcher(source)
+        poll('no revision, first poll', (True, True))
+        poll('no revision, same rows', (False, True))
+
+        source.table = edit(rows, 0.2)
+        poll('no revision, changed', (True, True))
+
+        try:
+            SheetSource()
+            checks.append(('abstract source', 'created', 'refused'))
+        except TypeError:
+            checks.append(('abstract source', 'refused', 'refused'))
+
+    failed = False
+    for name, result, expected in checks:
+        print(f'{name:25} {result} (expected {expected})')
+        failed = failed or result != expected
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
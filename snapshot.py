@@ -0,0 +1,284 @@
+"""The snapshot of the caches and the parsed sheets on the disk for the warm start.
+
+The updater writes the snapshot after the cycles, main reads it on the start, so the handlers answer
+from the restored caches at once and the updaters compare only the rows changed since the snapshot.
+The file is the magic, the version and the zlib compressed JSON of the plain records, the classes of the bot
+aren't stored, so they can change without breaking the snapshot. The file is replaced atomically.
+
+    python snapshot.py  # print the contents of the snapshot
+
+"""
+
+import configParser
+import get
+import auth
+import names
+import leader
+from schedule_parser import Person, Event
+from datetime import datetime
+import json
+import os
+import struct
+import tempfile
+import zlib
+import logging
+
+# Connect logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+MAGIC = b'EVSNAP'
+VERSION = 2  # the snapshots of the other versions are ignored
+HEADER = struct.Struct('>6sH')
+
+snapshot_path = getattr(configParser, 'snapshot_path', 'snapshot.bin')  # '' turns the snapshot off
+snapshot_seconds = getattr(configParser, 'snapshot_seconds', 300)  # the snapshot of the unchanged sheets is written this often
+
+state = {}  # the state read on the start, the updaters take their parts from it
+
+
+def dump(data: dict, path=snapshot_path) -> None:
+    """The function of writing the snapshot atomically: to the temporary file and then over the old one.
+
+    :param data: the state to write
+    :type data: dict
+
+    :param path: path of the snapshot file
+    :type path: str
+
+    :return: nothing
+    :rtype: None
+    """
+
+    body = zlib.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode())
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.snapshot-')
+
+    try:
+        with os.fdopen(descriptor, 'wb') as snapshot_file:
+            snapshot_file.write(HEADER.pack(MAGIC, VERSION))
+            snapshot_file.write(body)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+
+        os.replace(temporary, path)
+
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def read(path=snapshot_path) -> dict or None:
+    """The function of reading the snapshot.
+
+    :param path: path of the snapshot file
+    :type path: str
+
+    :return: the state or None if there is no snapshot or it can't be read
+    :rtype: dict | None
+    """
+
+    try:
+        with open(path, 'rb') as snapshot_file:
+            magic, version = HEADER.unpack(snapshot_file.read(HEADER.size))
+
+            if magic != MAGIC or version != VERSION:
+                print(f'{datetime.now()} - bot.snapshot.read - {path} has the version {version}, {VERSION} is expected')
+                return None
+
+            return json.loads(zlib.decompress(snapshot_file.read()))
+
+    except FileNotFoundError:
+        return None
+
+    except Exception as e:
+        print(f'{datetime.now()} - bot.snapshot.read - {e}')
+        return None
+
+
+def schedule_record(person_id: int, entry: dict, keys: list) -> list:
+    """The function of turning the cached schedule into the record of the snapshot.
+
+    :param person_id: the person's db id
+    :type person_id: int
+
+    :param entry: the schedule as the get.schedule function returns
+    :type entry: dict
+
+    :param keys: the keys of the schedule in the cache
+    :type keys: list[tuple, ...]
+
+    :return: the record as [id, first name, surname, tg username, tg chat id, events, messages, keys],
+        every event is [action, start, end]
+    :rtype: list
+    """
+
+    return [
+        person_id, entry['first_name'], entry['last_name'], entry['tg_username'], entry['tg_chat_id'],
+        [[event.action, event.start.isoformat(), event.end.isoformat()] for event in entry['events']],
+        entry['messages'],
+        [list(key) for key in keys]
+    ]
+
+
+def schedule_entry(record: list) -> tuple:
+    """The function of turning the record of the snapshot into the cached schedule.
+
+    :param record: the record from the schedule_record function
+    :type record: list
+
+    :return: the person's db id, the schedule and its keys in the form of the get.schedules.put function
+    :rtype: tuple[int, dict, list[tuple, ...]]
+    """
+
+    person_id, first_name, last_name, username, chat_id, events, messages, keys = record
+    person = Person(name=first_name, surname=last_name, user_name=username, chat_id=chat_id)
+
+    entry = {
+        'id': person_id,
+        'first_name': first_name,
+        'last_name': last_name,
+        'tg_username': username,
+        'tg_chat_id': chat_id,
+        'events': [
+            Event(person=person, action=action, start=datetime.fromisoformat(start), end=datetime.fromisoformat(end))
+            for action, start, end in events
+        ],
+        'messages': messages
+    }
+
+    return person_id, entry, [tuple(key) for key in keys]
+
+
+def updater_record(state: dict) -> dict:
+    """The function of turning the state of the EventUpdater into the record of the snapshot.
+
+    :param state: the state from the EventUpdater.state function
+    :type state: dict
+
+    :return: the record with the alerts as [tg username, start, action]
+    :rtype: dict
+    """
+
+    return {
+        'revision': state['revision'],
+        'digest': state['digest'],
+        'fingerprints': state['fingerprints'],
+        'alerts': [[username, start.isoformat(), action] for username, start, action in state['alerts']],
+        'fired': [[username, start.isoformat(), action] for username, start, action in state['fired']]
+    }
+
+
+def updater_state(record: dict) -> dict:
+    """The function of turning the record of the snapshot into the state of the EventUpdater.
+
+    :param record: the record from the updater_record function
+    :type record: dict
+
+    :return: the state for the EventUpdater.restore function
+    :rtype: dict
+    """
+
+    return {
+        'revision': record['revision'],
+        'digest': record['digest'],
+        'fingerprints': record['fingerprints'],
+        'alerts': [(username, datetime.fromisoformat(start), action) for username, start, action in record['alerts']],
+        'fired': [(username, datetime.fromisoformat(start), action) for username, start, action in record['fired']]
+    }
+
+
+def save(updaters: list, path=snapshot_path) -> bool:
+    """The function of writing the caches and the state of the updaters.
+
+    :param updaters: the EventUpdater objects
+    :type updaters: list[EventUpdater, ...]
+
+    :param path: path of the snapshot file, the snapshot isn't written if it is empty
+    :type path: str
+
+    :return: True if the snapshot is written
+    :rtype: bool
+    """
+
+    if not path:
+        return False
+
+    try:
+        dump({
+            'created': datetime.now().isoformat(),
+            'revision': leader.election.revision,
+            'auth': auth.users.items(),
+            'names': [[person_id, person['first_name'], person['last_name']] for person_id, person in names.index.items().items()],
+            'schedules': [schedule_record(*item) for item in get.schedules.items()],
+            'events': {updater.sheet.id: updater_record(updater.state()) for updater in updaters}
+        }, path)
+
+    except Exception as e:
+        print(f'{datetime.now()} - bot.snapshot.save - {e}')
+        return False
+
+    return True
+
+
+def restore(path=snapshot_path) -> bool:
+    """The function of filling the caches from the snapshot.
+    The db revision of the snapshot is given to the election, so the caches are read from the db again
+    on the first heartbeat if another replica has changed the db since the snapshot.
+
+    :param path: path of the snapshot file
+    :type path: str
+
+    :return: True if the caches are restored, otherwise they should be read from the db
+    :rtype: bool
+    """
+
+    data = read(path) if path else None
+    if not data:
+        return False
+
+    try:
+        users = auth.AuthCache()
+        users.load(data['auth'])
+
+        index = names.NameIndex()
+        index.load({
+            person_id: {'first_name': first_name, 'last_name': last_name}
+            for person_id, first_name, last_name in data['names']
+        })
+
+        entries = [schedule_entry(record) for record in data['schedules']]
+        events = {event_id: updater_state(record) for event_id, record in data['events'].items()}
+
+    except Exception as e:
+        print(f'{datetime.now()} - bot.snapshot.restore - {e}')
+        return False
+
+    auth.users, names.index = users, index
+
+    get.schedules.clear()
+    for person_id, entry, keys in entries:
+        get.schedules.put(person_id, entry, keys)
+
+    leader.election.revision = data['revision']
+    state.clear()
+    state.update(created=data['created'], revision=data['revision'], events=events)
+
+    print(f'{datetime.now()} - bot.snapshot.restore - the snapshot of {data["created"]} is restored')
+
+    return True
+
+
+if __name__ == '__main__':
+    snapshot = read()
+
+    if snapshot is None:
+        print(f'{datetime.now()} - bot.snapshot - there is no snapshot at {snapshot_path}')
+
+    else:
+        print(f'created: {snapshot["created"]}, db revision: {snapshot["revision"]}')
+        print(f'organizers: {len(snapshot["auth"])}, people: {len(snapshot["names"])}, schedules: {len(snapshot["schedules"])}')
+        for event_id, event in snapshot['events'].items():
+            print(f'{event_id}: people: {len(event["fingerprints"])}, sheet revision: {event["revision"]}')
@@ -1,9 +1,19 @@
 import get
+import auth
+import metrics
+import leader
+import snapshot
+import configParser
 from create import PersonDB
-from schedule_parser import parser
+from notify import Dispatcher
+from render import rows_messages, MESSAGE_LENGTH
+from alerts import AlertScheduler
+from schedule_parser import parse_rows, event_sheets, EventSheet, GoogleSheetSource, SheetWatcher, QuotaExceeded
+from concurrent.futures import ThreadPoolExecutor
+import os
 import time
 from telebot import TeleBot
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 
 # Connect logging
@@ -13,9 +23,259 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+workers = getattr(configParser, 'event_workers', min(os.cpu_count() or 1, 8))  # the events updated at once
+poll_min_seconds = getattr(configParser, 'poll_min_seconds', 15)  # the interval after a change
+poll_max_seconds = getattr(configParser, 'poll_max_seconds', 300)  # the interval of the idle spreadsheet
+poll_busy_seconds = getattr(configParser, 'poll_busy_seconds', 30)  # the interval while an alert is near
+poll_near_minutes = getattr(configParser, 'poll_near_minutes', 30)  # how long before the alert the polling is busy
+
+
+class AdaptiveInterval:
+    """The object chooses the time until the next poll of the spreadsheet.
+    The interval drops to the minimum after a change and doubles while nothing changes up to the maximum.
+    It is not longer than the busy one while an alert is near and not shorter than the Retry-After of the quota error.
+
+    minimum - the interval after a change in seconds
+    maximum - the longest interval in seconds
+    busy - the longest interval while an alert is near in seconds
+    near - how long before the alert the polling is busy
+    factor - the growth of the interval without changes
+    seconds - the current interval
+    reason - why the current interval was chosen: change, idle, activity, quota or error
+
+    """
+
+    def __init__(self,
+                 minimum=poll_min_seconds,
+                 maximum=poll_max_seconds,
+                 busy=poll_busy_seconds,
+                 near=timedelta(minutes=poll_near_minutes),
+                 factor=2.0
+                 ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.busy = busy
+        self.near = near
+        self.factor = factor
+        self.seconds = minimum
+        self.reason = 'change'
+
+    def __repr__(self):
+        return f'<AdaptiveInterval(seconds="{self.seconds}", reason="{self.reason}")>'
+
+    def reset(self) -> None:
+        self.seconds = self.minimum
+        self.reason = 'change'
+
+    def next(self, result: str, next_alert=None, retry_after=None) -> float:
+        """The function of choosing the interval after the poll.
+
+        :param result: the result of the poll: changed, unchanged, quota or error
+        :type result: str
+
+        :param next_alert: time of the nearest alert or None
+        :type next_alert: datetime | None
+
+        :param retry_after: seconds to wait after the quota error or None
+        :type retry_after: float | None
+
+        :return: the interval in seconds
+        :rtype: float
+        """
+
+        if result == 'changed':
+            self.seconds, self.reason = self.minimum, 'change'
+
+        elif result == 'quota':  # the quota is honored even while an alert is near
+            seconds = min(max(self.seconds * self.factor, self.minimum), self.maximum)
+            self.seconds, self.reason = max(seconds, retry_after or 0), 'quota'
+            return self.seconds
+
+        else:
+            self.seconds, self.reason = min(self.seconds * self.factor, self.maximum), 'idle' if result == 'unchanged' else 'error'
+
+        if next_alert is not None and next_alert - datetime.now() < self.near and self.seconds > self.busy:
+            self.seconds, self.reason = max(self.busy, self.minimum), 'activity'
+
+        return self.seconds
+
+
+class EventUpdater:
+    """The object updates the schedule of one event of the bot.
+
+    sheet - the EventSheet object
+    watcher - the SheetWatcher of the event's spreadsheet
+    fingerprints - fingerprints of the people's rows from the last parse
+    touched - db ids of the people changed since they were published to the other replicas
+    alerts - the AlertScheduler of the event
+    send - function queueing the message, takes the chat id and the text
+    header - the first line of the message about the changes
+    interval - the AdaptiveInterval of the polls
+    due - monotonic time of the next poll
+
+    """
+
+    def __init__(self, sheet: EventSheet, send, several=False):
+        self.sheet = sheet
+        self.watcher = SheetWatcher(GoogleSheetSource(sheet.spreadsheet_id, sheet.ranges))
+        self.fingerprints = {}
+        self.touched = set()
+        self.alerts = AlertScheduler(send=send)
+        self.send = send
+        self.header = f'Расписание изменено ({sheet.title}):\n' if several else 'Расписание изменено:\n'
+        self.interval = AdaptiveInterval()
+        self.due = 0.0
+
+    def __repr__(self):
+        return f'<EventUpdater(sheet={self.sheet}, people="{len(self.fingerprints)}", interval={self.interval})>'
+
+    def reset(self) -> None:
+        """The function of forgetting the state of the spreadsheet and cancelling the alerts,
+        the next poll compares the whole table with the db.
+
+        :return: nothing
+        :rtype: None
+        """
+
+        self.watcher.revision = self.watcher.digest = None
+        self.fingerprints = {}
+        self.alerts.clear()
+        self.interval.reset()
+        self.due = 0.0
+
+    def state(self) -> dict:
+        """The function of getting the state of the updater for the snapshot.
+
+        :return: the revision and the hash of the spreadsheet, the fingerprints, the alerts to send
+            and the sent alerts of the changes that haven't begun yet
+        :rtype: dict
+        """
+
+        now = datetime.now()
+
+        with self.alerts.condition:
+            fired = [alert for alert in self.alerts.fired if alert[1] > now]
+
+        return {
+            'revision': self.watcher.revision,
+            'digest': self.watcher.digest,
+            'fingerprints': dict(self.fingerprints),
+            'alerts': self.alerts.items(),
+            'fired': fired
+        }
+
+    def restore(self, state: dict) -> None:
+        """The function of continuing from the state of the snapshot, the next poll parses only the rows changed since it.
+        The alerts are scheduled again, the sent ones aren't sent twice.
+
+        :param state: the state from the state function
+        :type state: dict
+
+        :return: nothing
+        :rtype: None
+        """
+
+        self.watcher.revision, self.watcher.digest = state['revision'], state['digest']
+        self.fingerprints = state['fingerprints']
+
+        with self.alerts.condition:
+            self.alerts.fired.update(state['fired'])
+
+        self.alerts.load(state['alerts'])
+
+    def poll(self) -> bool:
+        """The function of updating the db if the spreadsheet of the event has changed
+        and choosing the time of the next poll.
+
+        :return: True if the spreadsheet has changed
+        :rtype: bool
+        """
+
+        event_id = self.sheet.id
+        result, retry_after = self.update()
+
+        seconds = self.interval.next(result, next_alert=self.alerts.next_alert(), retry_after=retry_after)
+        self.due = time.monotonic() + seconds
+
+        metrics.event_polls.inc(result=result, event=event_id)
+        metrics.poll_interval_seconds.set(seconds, event=event_id)
+        metrics.poll_decisions.inc(reason=self.interval.reason, event=event_id)
+
+        return result == 'changed'
+
+    def update(self) -> tuple:
+        """The function of updating the db if the spreadsheet of the event has changed.
+
+        :return: the result: changed, unchanged, quota or error, and the seconds to wait after the quota error
+        :rtype: tuple[str, float | None]
+        """
+
+        event_id = self.sheet.id
+
+        try:
+            with metrics.update_stage_seconds.time(stage='fetch', event=event_id):
+                rows = self.watcher.poll()
+
+            if rows is None:
+                return 'unchanged', None
+
+            with metrics.update_stage_seconds.time(stage='parse', event=event_id):
+                parsed = parse_rows(rows, self.fingerprints, default_date=self.sheet.start_date)
+            metrics.rows_parsed.inc(len(parsed.fingerprints), event=event_id)
+
+            # without the fingerprints the whole schedule of the event is compared, so the people
+            # removed from the table since the last parse of another process are removed too
+            new_events = get.events_to_db(
+                parsed.events, changed=parsed.changed if self.fingerprints else None, removed=parsed.removed,
+                event_id=event_id, touched=self.touched
+            )
+            self.fingerprints = parsed.fingerprints
+
+            with metrics.update_stage_seconds.time(stage='notify', event=event_id):
+                for username, events in parsed.events.by_person():
+                    self.alerts.update(username, events)
+                for username in parsed.removed:
+                    self.alerts.remove(username)
+
+                for username in parsed.changed:  # render the new schedules before they are requested
+                    get.schedule(username=username)
+
+                for chat_id, messages in new_events.items():
+                    if chat_id:  # every part of the long list fits the tg message with the header
+                        for text in rows_messages(messages, length=MESSAGE_LENGTH - len(self.header)):
+                            self.send(chat_id, self.header + text)
+
+            if new_events:
+                print(f'INFO: {datetime.now()} - db.update.EventUpdater.update - db of the event "{event_id}" was update')
+
+            return 'changed', None
+
+        except QuotaExceeded as e:
+            print(f'{datetime.now()} - db.update.EventUpdater.update - {event_id} - quota exceeded - {e}')
+            return 'quota', e.retry_after
+
+        except Exception as e:
+            self.watcher.revision = self.watcher.digest = None  # the changes may be not saved, compare them again
+            print(f'{datetime.now()} - db.update.EventUpdater.update - {event_id} - {e}')
+
+        return 'error', None
+
 
 def database(bot: TeleBot) -> None:
     """The function of updating the db.
+    Every event of the bot is polled by its EventUpdater, the events are polled in parallel by the bounded pool.
+    The table is parsed and compared with the db only when the spreadsheet has changed,
+    and only the events of the people whose rows have changed are compared.
+    The messages about the changes are queued to the Dispatcher,
+    the AlertScheduler of the event gets the new schedules of the changed people.
+    The durations of the stages and the counters of the cycle are written to the metrics.
+    Every event is polled when its AdaptiveInterval has passed, the loop wakes up for the nearest one.
+    Only the leader of the replicas polls the events, the replica that has stepped down forgets the state
+    and the alerts, so the new leader compares the whole tables and sends the alerts alone.
+    The state of the updaters is restored from the snapshot of the last run when the replica becomes the leader
+    and written to it after the cycles with changes or every snapshot_seconds, so the restarted bot compares
+    only the new changes. The alerts of the event start after its first poll as the leader,
+    so the restored alerts of the people changed since the snapshot are replaced before they are sent.
 
     :param bot: the bot object
     :type bot: TeleBot
@@ -24,51 +284,79 @@ def database(bot: TeleBot) -> None:
     :rtype: None
     """
 
+    dispatcher = Dispatcher(bot)  # the messages are sent in the background
+    dispatcher.start()
+
+    sheets = event_sheets()
+    updaters = [EventUpdater(sheet, send=dispatcher.put, several=len(sheets) > 1) for sheet in sheets]
+    restored = snapshot.state.get('events', {})  # the state is taken by the first leadership only
+    snapshot.state.clear()
+
+    metrics.registry.collect(lambda: metrics.messages_pending.set(dispatcher.pending()))
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(updaters))), thread_name_prefix='event')
+
+    leading = False
+    saved = time.monotonic()
+
     while True:
         # print(f'INFO: {datetime.now()} - db.update.database - db is updating')
 
-        try:
-            new_events = get.events_to_db(parser())
+        if not leader.election.is_leader():
+            if leading:  # another replica runs the updater now
+                for updater in updaters:
+                    updater.reset()
+                leading = False
 
-            for chat_id in new_events.keys():
-                if chat_id:
+            time.sleep(leader.election.interval)
+            continue
 
-                    messages = new_events[chat_id]
-                    message = ''
+        if not leading:  # the replica has become the leader
+            for updater in updaters:
+                if updater.sheet.id in restored:
+                    updater.restore(restored.pop(updater.sheet.id))
+            leading = True
 
-                    for new_event in messages:
-                        if 'Смена деятельности:\n' in new_event:
-                            bot.send_message(
-                                chat_id=chat_id,
-                                text=new_event
-                            )
+        due = [updater for updater in updaters if updater.due <= time.monotonic()]
 
-                        else:
-                            message += new_event + '\n'
+        if not due:  # wake up for the nearest poll, but check the leadership meanwhile
+            nearest = min(updater.due for updater in updaters) - time.monotonic()
+            time.sleep(max(0.0, min(nearest, leader.election.interval)))
+            continue
 
-                    if message:
-                        bot.send_message(
-                            chat_id=chat_id,
-                            text='Расписание изменено:\n' + message
-                        )
+        cycle_start = time.perf_counter()
+        queries = metrics.db_queries.value()
+        changed = []
 
-                    time.sleep(0.2)
-
-            if new_events:
-                print(f'INFO: {datetime.now()} - db.update.database - db was update')
+        try:
+            # the events are independent, one failed event doesn't stop the others
+            changed = list(executor.map(lambda updater: leader.election.is_leader() and updater.poll(), due))
 
-            # else:
-            # print(f'INFO: {datetime.now()} - db.update.database - completion db update')
+            if any(changed):  # the other replicas refresh the changed people in their caches
+                touched = set().union(*(updater.touched for updater in due))
+                for updater in due:
+                    updater.touched = set()
 
-            time.sleep(60)
+                leader.election.changed(touched)
 
         except Exception as e:
             print(f'{datetime.now()} - db.update.database - {e}')
 
+        for updater in due:
+            if not updater.alerts.running:
+                updater.alerts.start()
+
+        metrics.update_cycle_seconds.observe(time.perf_counter() - cycle_start)
+        metrics.cycle_db_queries.set(metrics.db_queries.value() - queries)
+
+        if any(changed) or time.monotonic() - saved > snapshot.snapshot_seconds:
+            snapshot.save(updaters)
+            saved = time.monotonic()
+
 
 def tg_chat_id(username: str, chat_id: int) -> int:
     """The function of updating the person's tg chat in the db.
-    The function is authorization.
+    The function is authorization, the chat is authorized in the auth cache too.
 
     :param username: the user's tg username
     :type username: str
@@ -80,14 +368,17 @@ def tg_chat_id(username: str, chat_id: int) -> int:
     :rtype: int
     """
 
-    session = get.session()
-    persondb = session.query(PersonDB).filter_by(tg_username=username).first()
+    with get.session_scope() as ssn:
+        persondb = ssn.query(PersonDB).filter_by(tg_username=username).first()
 
-    if not persondb:
-        return 0
+        if not persondb:
+            return 0
 
-    persondb.tg_chat_id = chat_id
+        persondb.tg_chat_id = chat_id
+        person_id = persondb.id
 
-    session.commit()
+    get.schedules.update(person_id, tg_chat_id=chat_id)  # the rest of the cached schedule is the same
+    auth.users.login(person_id, chat_id)
+    leader.election.changed([person_id])
 
-    return persondb.tg_chat_id
+    return chat_id
@@ -0,0 +1,72 @@
+from telebot import TeleBot, types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime
+import hmac
+import logging
+
+# Connect logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def server(bot: TeleBot, secret: str, host='127.0.0.1', port=8443, path='/') -> ThreadingHTTPServer:
+    """The function of creating the local HTTP server receiving the updates from telegram.
+    Every update posted to the path with the right secret token is passed to the handlers of the bot.
+
+    :param bot: the bot object
+    :type bot: TeleBot
+
+    :param secret: the secret token set with the webhook
+    :type secret: str
+
+    :param host: the address to listen on
+    :type host: str
+
+    :param port: the port to listen on
+    :type port: int
+
+    :param path: the path of the webhook
+    :type path: str
+
+    :return: the server, call serve_forever to start it
+    :rtype: ThreadingHTTPServer
+    """
+
+    if not secret:  # anyone knowing the url could post the updates otherwise
+        raise ValueError('the secret token of the webhook is empty')
+
+    class UpdateHandler(BaseHTTPRequestHandler):
+        """The handler of the requests to the webhook."""
+
+        def do_POST(self):
+            if self.path != path:
+                return self.reply(404)
+
+            token = self.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+            if not hmac.compare_digest(token.encode(), secret.encode()):
+                return self.reply(403)
+
+            try:
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                update = types.Update.de_json(body.decode('utf-8'))
+
+            except Exception as e:
+                print(f'{datetime.now()} - bot.webhook.server - {e}')
+                return self.reply(400)
+
+            bot.process_new_updates([update])
+
+            return self.reply(200)
+
+        def reply(self, code: int) -> None:
+            self.send_response(code)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass  # every update would be printed otherwise
+
+    return ThreadingHTTPServer((host, port), UpdateHandler)
@@ -0,0 +1,119 @@
+"""The offline check of the webhook server with the recorded update.
+
+Starts the webhook server of the bot on a local port, with the stand-ins of the bench for the configs,
+posts the recorded /help update with the right and the wrong secret token, to the wrong path
+and with the broken body, and prints the answers and the messages the handlers have sent.
+
+    python webhook_check.py
+
+"""
+
+from bench import configure
+from threading import Thread
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+import json
+import sys
+import tempfile
+import time
+
+SECRET = 'check-secret'
+
+UPDATE = {
+    'update_id': 10001,
+    'message': {
+        'message_id': 7,
+        'date': 1633161600,
+        'text': '/help',
+        'entities': [{'offset': 0, 'length': 5, 'type': 'bot_command'}],
+        'from': {'id': 555, 'is_bot': False, 'first_name': 'Имя', 'username': 'user0', 'language_code': 'ru'},
+        'chat': {'id': 555, 'type': 'private', 'first_name': 'Имя', 'username': 'user0'}
+    }
+}  # the /help command as telegram posts it
+
+
+def post(url: str, body: bytes, secret: str) -> int:
+    """The function of posting the update like telegram does.
+
+    :param url: url of the webhook
+    :type url: str
+
+    :param body: the body of the request
+    :type body: bytes
+
+    :param secret: the secret token of the request
+    :type secret: str
+
+    :return: the status of the answer
+    :rtype: int
+    """
+
+    request = Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'X-Telegram-Bot-Api-Secret-Token': secret
+    })
+
+    try:
+        with urlopen(request, timeout=5) as answer:
+            return answer.status
+
+    except HTTPError as e:
+        return e.code
+
+
+def main() -> None:
+    """The main function.
+    Runs the checks and exits with 1 if any answer isn't the expected one.
+
+    :return: nothing
+    :rtype: None
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(directory)
+
+        import main as bot_main
+        import webhook
+
+        sent = []
+        bot_main.bot.send_message = lambda chat_id, text, **kwargs: sent.append((chat_id, text))
+
+        server = webhook.server(bot_main.bot, SECRET, port=0, path='/hook')
+        Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+
+        body = json.dumps(UPDATE).encode()
+        checks = [
+            ('recorded update', post(f'{url}/hook', body, SECRET), 200),
+            ('wrong secret', post(f'{url}/hook', body, 'wrong'), 403),
+            ('no secret', post(f'{url}/hook', body, ''), 403),
+            ('wrong path', post(f'{url}/other', body, SECRET), 404),
+            ('broken body', post(f'{url}/hook', b'{"update_id":', SECRET), 400)
+        ]
+
+        for _ in range(50):  # the update is handled by the pool of the bot
+            if sent:
+                break
+            time.sleep(0.1)
+
+        server.shutdown()
+
+        try:
+            webhook.server(bot_main.bot, '', port=0)
+            checks.append(('empty secret refused', 'started', 'refused'))
+        except ValueError:
+            checks.append(('empty secret refused', 'refused', 'refused'))
+
+    failed = False
+    for name, status, expected in checks:
+        print(f'{name:22} {status} (expected {expected})')
+        failed = failed or status != expected
+
+    print(f'sent messages: {sent}')
+    failed = failed or len(sent) != 1 or sent[0][0] != UPDATE['message']['chat']['id']
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()